@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+    bench_build
+    ~~~~~~~~~~~
+
+    Time the build phases of a synthetic project::
+
+        $ python bench/bench_build.py [--preset small|medium|otp] [--modules N]
+                [--functions N] [--xrefs N] [--jobs N] [--json FILE]
+                [--compare FILE]
+
+    See ``synthetic.add_arguments`` for all parameters of the project.
+    ``--preset otp`` generates 10k modules and 300k references.
+
+    A full build, and an incremental rebuild after one module is changed,
+    each run in a child process so that its peak memory is reported.
+    The phases are:
+
+    read
+      from ``env-before-read-docs`` to ``env-updated``.
+    resolve
+      post-transforms of all written documents, which resolve references.
+    inventory
+      writing ``objects.inv``.
+    total
+      the whole ``app.build()``.
+
+    ``--json`` saves the results, and ``--compare`` shows the ratios to
+    results saved before.
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+TOPDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOPDIR)
+sys.path.insert(0, os.path.join(TOPDIR, 'bench'))
+
+import synthetic
+
+PHASES = ['read', 'resolve', 'inventory', 'total']
+BUILDS = ['full', 'incremental']
+
+
+def run_build(srcdir, outdir, builder, jobs, fresh, profile):
+    # runs in a child process. -> results of a build.
+    import sphinx
+    from sphinx.application import Sphinx
+    from sphinx.environment import BuildEnvironment
+    from sphinx.util.inventory import InventoryFile
+
+    timings = dict((phase, 0.0) for phase in PHASES)
+
+    def timed(phase, func):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings[phase] += time.perf_counter() - start
+        return wrapper
+
+    BuildEnvironment.apply_post_transforms = timed(
+        'resolve', BuildEnvironment.apply_post_transforms)
+    InventoryFile.dump = staticmethod(timed('inventory', InventoryFile.dump))
+
+    marks = {}
+    warning = io.StringIO()
+    app = Sphinx(srcdir, srcdir, outdir, os.path.join(outdir, '.doctrees'), builder,
+                 confoverrides={'erl_profile': profile},
+                 status=None, warning=warning, freshenv=fresh, parallel=jobs)
+    app.connect('env-before-read-docs',
+                lambda app, env, docnames: marks.setdefault('read', time.perf_counter()))
+    app.connect('env-updated',
+                lambda app, env: timings.__setitem__('read', time.perf_counter() - marks['read']))
+
+    start = time.perf_counter()
+    app.build()
+    timings['total'] = time.perf_counter() - start
+
+    results = {
+        'sphinx'         : sphinx.__version__,
+        'timings'        : timings,
+        'warnings'       : warning.getvalue().count('WARNING'),
+        # kilobytes on Linux.
+        'peak_rss_kb'    : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'children_rss_kb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    }
+    if profile:
+        with open(os.path.join(outdir, 'erl-profile.json')) as fp:
+            results['profile'] = json.load(fp)
+    return results
+
+
+def spawn_build(srcdir, outdir, args, fresh):
+    command = [sys.executable, os.path.abspath(__file__), '--run-build', srcdir, outdir,
+               '--builder', args.builder, '--jobs', str(args.jobs)]
+    if fresh:
+        command.append('--fresh')
+    if args.profile:
+        command.append('--profile')
+    out = subprocess.run(command, check=True, stdout=subprocess.PIPE).stdout
+    return json.loads(out.decode('utf-8'))
+
+
+def print_results(results, base=None):
+    def row(label, get, fmt):
+        cells = []
+        for build in BUILDS:
+            value = get(results[build])
+            text = fmt % (value,)
+            prev = base and get(base[build])
+            if prev:
+                text += ' (x%.2f)' % (value / prev,)
+            cells.append(text)
+        print('%-16s %24s %24s' % (label, cells[0], cells[1]))
+
+    params = results['params']
+    print('modules: %d, objects: %d, references: %d, builder: %s, jobs: %d'
+          % (params['modules'], results['objects'], results['xrefs'],
+             results['builder'], results['jobs']))
+    print('%-16s %24s %24s' % ('', 'full', 'incremental'))
+    for phase in PHASES:
+        row(phase, lambda r: r['timings'][phase], '%.3fs')
+    row('peak RSS', lambda r: r['peak_rss_kb'] / 1024, '%.1fMB')
+    row('children RSS', lambda r: r['children_rss_kb'] / 1024, '%.1fMB')
+    row('warnings', lambda r: r['warnings'], '%d')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    synthetic.add_arguments(parser)
+    parser.add_argument('--builder', default='html')
+    parser.add_argument('--jobs', type=int, default=1)
+    parser.add_argument('--profile', action='store_true',
+                        help='include the report of erl_profile')
+    parser.add_argument('--json', help='save the results')
+    parser.add_argument('--compare', help='results saved by --json before')
+    parser.add_argument('--run-build', nargs=2, metavar=('SRCDIR', 'OUTDIR'),
+                        help=argparse.SUPPRESS)
+    parser.add_argument('--fresh', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_build:
+        (srcdir, outdir) = args.run_build
+        results = run_build(srcdir, outdir, args.builder, args.jobs, args.fresh, args.profile)
+        print(json.dumps(results))
+        return
+
+    params = synthetic.Params.from_args(args)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        srcdir = os.path.join(tmpdir, 'src')
+        outdir = os.path.join(tmpdir, 'out')
+        start = time.perf_counter()
+        synthetic.generate_project(srcdir, params)
+        generate = time.perf_counter() - start
+
+        full = spawn_build(srcdir, outdir, args, fresh=True)
+        synthetic.touch_module(srcdir, params.modules // 2)
+        incremental = spawn_build(srcdir, outdir, args, fresh=False)
+    finally:
+        shutil.rmtree(tmpdir)
+
+    results = {
+        'params'     : params.to_dict(),
+        'objects'    : params.num_objects(),
+        'xrefs'      : params.num_xrefs(),
+        'builder'    : args.builder,
+        'jobs'       : args.jobs,
+        'generate'   : generate,
+        'full'       : full,
+        'incremental': incremental,
+    }
+
+    base = None
+    if args.compare:
+        with open(args.compare) as fp:
+            base = json.load(fp)
+    print_results(results, base)
+
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+    bench_env
+    ~~~~~~~~~
+
+    Time saving and loading the environment of a synthetic project::
+
+        $ python bench/bench_env.py [--preset small|medium|otp] [--modules N]
+                [--functions N] [--repeat N]
+
+    A synthetic project (``--preset medium`` by default) is read, then the
+    environment is pickled and loaded as Sphinx does between builds.
+    ``env.domaindata['erl']`` alone is timed too.
+"""
+import argparse
+import io
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+
+TOPDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOPDIR)
+sys.path.insert(0, os.path.join(TOPDIR, 'bench'))
+
+from sphinx.application import Sphinx
+
+import synthetic
+
+
+def best_of(repeat, func):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def report(label, obj, repeat):
+    dump_time, pickled = best_of(repeat, lambda: pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+    load_time, _loaded = best_of(repeat, lambda: pickle.loads(pickled))
+    print('%-12s %10d bytes   dump %.3fs   load %.3fs'
+          % (label, len(pickled), dump_time, load_time))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    synthetic.add_arguments(parser)
+    parser.set_defaults(preset='medium')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    params = synthetic.Params.from_args(args)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        srcdir = os.path.join(tmpdir, 'src')
+        synthetic.generate_project(srcdir, params)
+        outdir = os.path.join(tmpdir, 'out')
+        app = Sphinx(srcdir, srcdir, outdir, os.path.join(outdir, '.doctrees'), 'dummy',
+                     status=None, warning=io.StringIO(), freshenv=True)
+        app.build()
+        env = app.env
+    finally:
+        shutil.rmtree(tmpdir)
+
+    print('modules: %d, objects: %d' % (params.modules, params.num_objects()))
+    report('environment', env, args.repeat)
+    report('erl domain', env.domaindata['erl'], args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+    bench_inventory
+    ~~~~~~~~~~~~~~~
+
+    Compare ``objects.inv`` written with each ``erl_inventory_mode``::
+
+        $ python bench/bench_inventory.py [--repeat N] [PROJECT_DIR]
+
+    PROJECT_DIR defaults to ``examples/erts``. It is built into a temporary
+    directory for each mode, then the size of the inventory and the time
+    to load it are reported.
+"""
+import argparse
+import io
+import os
+import posixpath
+import shutil
+import sys
+import tempfile
+import time
+
+TOPDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOPDIR)
+
+from sphinx.application import Sphinx
+from sphinx.util.inventory import InventoryFile
+
+MODES = ['full', 'compact']
+
+
+def build(srcdir, outdir, mode):
+    app = Sphinx(srcdir, srcdir, outdir, os.path.join(outdir, '.doctrees'), 'html',
+                 confoverrides={'erl_inventory_mode': mode,
+                                'intersphinx_mapping': {}},
+                 status=None, warning=io.StringIO(), freshenv=True)
+    app.build()
+    return os.path.join(outdir, 'objects.inv')
+
+
+def load(path):
+    with open(path, 'rb') as fp:
+        return InventoryFile.load(fp, '', posixpath.join)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('srcdir', nargs='?', default=os.path.join(TOPDIR, 'examples', 'erts'))
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        print('%-8s %10s %8s %12s' % ('mode', 'bytes', 'erl:*', 'load [ms]'))
+        for mode in MODES:
+            path = build(args.srcdir, os.path.join(tmpdir, mode), mode)
+            inv  = load(path)
+            num_entries = sum(len(v) for (k, v) in inv.items() if k.startswith('erl:'))
+
+            t0 = time.perf_counter()
+            for _ in range(args.repeat):
+                load(path)
+            elapsed = (time.perf_counter() - t0) / args.repeat
+
+            print('%-8s %10d %8d %12.3f' % (mode, os.path.getsize(path), num_entries, elapsed * 1000))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
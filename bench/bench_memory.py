@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+    bench_memory
+    ~~~~~~~~~~~~
+
+    Report the size of the Erlang domain data per documented object::
+
+        $ python bench/bench_memory.py [--modules N] [--functions N]
+
+    A synthetic project is read, then ``env.domaindata['erl']`` is pickled
+    and loaded again under tracemalloc.
+"""
+import argparse
+import io
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import tracemalloc
+
+TOPDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOPDIR)
+sys.path.insert(0, os.path.join(TOPDIR, 'bench'))
+
+from sphinx.application import Sphinx
+
+import synthetic
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modules', type=int, default=100)
+    parser.add_argument('--functions', type=int, default=50)
+    args = parser.parse_args()
+
+    params = synthetic.Params(modules=args.modules, functions=args.functions, xrefs=0)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        srcdir = os.path.join(tmpdir, 'src')
+        synthetic.generate_project(srcdir, params)
+        outdir = os.path.join(tmpdir, 'out')
+        app = Sphinx(srcdir, srcdir, outdir, os.path.join(outdir, '.doctrees'), 'dummy',
+                     status=None, warning=io.StringIO(), freshenv=True)
+        app.build()
+        data = app.env.domaindata['erl']
+    finally:
+        shutil.rmtree(tmpdir)
+
+    pickled = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+
+    tracemalloc.start()
+    loaded = pickle.loads(pickled)
+    loaded_size, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    num_objects = params.num_objects()
+    print('objects:       %d' % (num_objects,))
+    print('pickled:       %d bytes, %.1f bytes/object' % (len(pickled), len(pickled) / num_objects))
+    print('loaded:        %d bytes, %.1f bytes/object' % (loaded_size, loaded_size / num_objects))
+    del loaded
+
+
+if __name__ == '__main__':
+    main()
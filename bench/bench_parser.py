@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+    bench_parser
+    ~~~~~~~~~~~~
+
+    Measure the throughput of ErlangSignatureParser in tokens per second.
+
+    Signatures are collected from the directives in the bundled ``test`` and
+    ``examples`` projects, plus some constructs they do not use::
+
+        $ python bench/bench_parser.py [--repeat N] [--dump]
+
+    ``--dump`` prints ``to_dict()`` of every signature instead, to compare
+    results between parser implementations.
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+TOPDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOPDIR)
+
+from sphinxcontrib.erlangdomain import ErlangSignatureParser
+
+RE_DIRECTIVE = re.compile(r'''
+    ^ \s* [.][.] \s+ (?:erl:)?(?:callback|clause|function|macro|opaque|record|type) ::
+    \s* (?P<sig> \S.*?) \s* $
+    ''', re.VERBOSE | re.MULTILINE)
+
+# constructs which the bundled documents do not use.
+EXTRA_SIGNATURES = [
+    'lists:map(Fun, List1) -> List2',
+    'io:format(Device, Fmt[, Args]) -> ok',
+    'erlang:send_after(Time, Dest, Msg[, Options]) -> TimerRef',
+    'foo(A, B = default) -> ok',
+    'bar({A, B}, [C | D], #{k := V}) -> {ok, [term()]} | {error, Reason}',
+    'split(N, List1) -> {List2, List3} when N :: non_neg_integer()',
+    'gen_server:call/2..3',
+    'is_integer/1 [@guard]',
+    'open(File, Modes)@raw -> {ok, IoDevice}',
+    '#file_info{ size :: non_neg_integer() }',
+    "?'MODULE'",
+    '?assertEqual(Expect, Expr)',
+    'erlang:iodata()',
+    'inet:socket()',
+    'gen_tcp:accept/1',
+]
+
+# same grammar as the parser, only to count tokens.
+RE_TOKEN = re.compile(r'''
+    \[, | [(){}\[\]] | [A-Za-z_]\w* | '[-\w.]+' | \d+
+    | -> | :: | [.]{2,} | [-+*/#?$<>=,.:|@]
+    ''', re.VERBOSE)
+
+
+def collect_signatures():
+    sigs = []
+    for subdir in ('test', 'examples'):
+        for dirpath, dirnames, filenames in os.walk(os.path.join(TOPDIR, subdir)):
+            dirnames[:] = [d for d in dirnames if d != '_build']
+            for filename in sorted(filenames):
+                if not filename.endswith('.rst'):
+                    continue
+                with open(os.path.join(dirpath, filename)) as fp:
+                    sigs.extend(m.group('sig') for m in RE_DIRECTIVE.finditer(fp.read()))
+    return sigs + EXTRA_SIGNATURES
+
+
+def parse_all(sigs):
+    ok = 0
+    for sig in sigs:
+        try:
+            ErlangSignatureParser.run(sig)
+            ok += 1
+        except ValueError:
+            pass
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--dump', action='store_true')
+    args = parser.parse_args()
+
+    sigs = collect_signatures()
+
+    if args.dump:
+        for sig in sigs:
+            try:
+                print('%r: %r' % (sig, sorted(ErlangSignatureParser.run(sig).to_dict().items())))
+            except ValueError:
+                print('%r: ValueError' % (sig,))
+        return
+
+    num_tokens = sum(len(RE_TOKEN.findall(sig)) for sig in sigs)
+
+    t0 = time.perf_counter()
+    for _ in range(args.repeat):
+        ok = parse_all(sigs)
+    elapsed = time.perf_counter() - t0
+
+    print('signatures: %d (%d valid)' % (len(sigs), ok))
+    print('tokens:     %d' % (num_tokens,))
+    print('elapsed:    %.3f s for %d rounds' % (elapsed, args.repeat))
+    print('throughput: %.0f tokens/s, %.0f signatures/s' % (
+        num_tokens * args.repeat / elapsed, len(sigs) * args.repeat / elapsed))
+
+
+if __name__ == '__main__':
+    main()
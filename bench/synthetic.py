@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+    synthetic
+    ~~~~~~~~~
+
+    Generator of synthetic Sphinx projects documenting Erlang modules,
+    used by the benchmarks in this directory.
+"""
+import os
+import random
+
+CONF_PY = '''\
+extensions = ['sphinxcontrib.erlangdomain']
+master_doc = 'index'
+exclude_patterns = ['_build']
+'''
+
+# presets for --preset of the benchmarks.
+#   otp: about the size of an OTP release, 10k modules and 300k references.
+PRESETS = {
+    'small' : dict(modules=50,    functions=20, xrefs=2),
+    'medium': dict(modules=1000,  functions=30, xrefs=1),
+    'otp'   : dict(modules=10000, functions=30, xrefs=1),
+}
+
+
+class Params:
+    def __init__(self, modules=10, functions=20, types=5, min_arity=0, max_arity=4,
+                 optional_ratio=0.2, range_ratio=0.0, flavor_ratio=0.1, xrefs=5,
+                 arity_xref_ratio=0.5, seed=0):
+        self.modules          = modules           # number of modules (documents).
+        self.functions        = functions         # functions per module.
+        self.types            = types             # types per module.
+        self.min_arity        = min_arity         # minimum number of arguments.
+        self.max_arity        = max_arity         # maximum number of arguments.
+        self.optional_ratio   = optional_ratio    # ratio of functions with an optional argument.
+        self.range_ratio      = range_ratio       # ratio of functions described as 'name/N..M'.
+        self.flavor_ratio     = flavor_ratio      # ratio of functions with a flavored clause.
+        self.xrefs            = xrefs             # cross references per function.
+        self.arity_xref_ratio = arity_xref_ratio  # ratio of references with arity.
+        self.seed             = seed
+
+    @classmethod
+    def from_args(cls, args):
+        # args of argparse, see add_arguments.
+        kwargs = dict(PRESETS[args.preset]) if args.preset else {}
+        for name in ('modules', 'functions', 'types', 'min_arity', 'max_arity',
+                     'optional_ratio', 'range_ratio', 'flavor_ratio', 'xrefs',
+                     'arity_xref_ratio', 'seed'):
+            value = getattr(args, name)
+            if value is not None:
+                kwargs[name] = value
+        return cls(**kwargs)
+
+    def num_objects(self):
+        return self.modules * (self.functions + self.types)
+
+    def num_xrefs(self):
+        return self.modules * self.functions * self.xrefs
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+def add_arguments(parser):
+    """
+    Add options of `Params` to an argparse parser.
+    """
+    parser.add_argument('--preset', choices=sorted(PRESETS))
+    for name in ('modules', 'functions', 'types', 'min_arity', 'max_arity', 'xrefs', 'seed'):
+        parser.add_argument('--' + name.replace('_', '-'), dest=name, type=int)
+    for name in ('optional_ratio', 'range_ratio', 'flavor_ratio', 'arity_xref_ratio'):
+        parser.add_argument('--' + name.replace('_', '-'), dest=name, type=float)
+
+
+def module_name(i):
+    return 'mod_%05d' % (i,)
+
+
+def function_name(j):
+    return 'fun_%04d' % (j,)
+
+
+def type_name(j):
+    return 'type_%04d' % (j,)
+
+
+def function_specs(params):
+    """
+    Return ``specs[i][j] = (arity, kind, flavored)`` of function j in module i.
+    ``kind`` is ``'plain'``, ``'optional'`` (one more optional argument)
+    or ``'range'``.
+    """
+    rng = random.Random(params.seed)
+    specs = []
+    for _i in range(params.modules):
+        module_specs = []
+        for _j in range(params.functions):
+            arity = rng.randint(params.min_arity, params.max_arity)
+            r = rng.random()
+            if r < params.range_ratio:
+                kind = 'range'
+            elif r < params.range_ratio + params.optional_ratio and arity > 0:
+                kind = 'optional'
+            else:
+                kind = 'plain'
+            module_specs.append((arity, kind, rng.random() < params.flavor_ratio))
+        specs.append(module_specs)
+    return specs
+
+
+def xref_target(params, specs, rng):
+    i = rng.randrange(params.modules)
+    j = rng.randrange(params.functions)
+    target = '%s:%s' % (module_name(i), function_name(j))
+    if rng.random() < params.arity_xref_ratio:
+        (arity, kind, _flavored) = specs[i][j]
+        if kind != 'plain':
+            arity += rng.randint(0, 1)
+        target += '/%d' % (arity,)
+    return target
+
+
+def generate_module(params, specs, rng, i):
+    modname = module_name(i)
+    lines = [
+        modname,
+        '=' * len(modname),
+        '',
+        '.. erl:module:: %s' % (modname,),
+        '   :synopsis: Synthetic module %d.' % (i,),
+        '',
+    ]
+
+    for j in range(params.types):
+        lines += [
+            '.. erl:type:: %s()' % (type_name(j),),
+            '',
+            '   Type %d.' % (j,),
+            '',
+        ]
+
+    for (j, (arity, kind, flavored)) in enumerate(specs[i]):
+        args = ['Arg%d' % (k,) for k in range(arity)]
+        ret_type = type_name(j % max(params.types, 1))
+        if kind == 'range':
+            sig_text = '%s/%d..%d' % (function_name(j), arity, arity + 1)
+        elif kind == 'optional':
+            sig_text = '%s(%s[, Opts]) -> %s()' % (function_name(j), ', '.join(args), ret_type)
+        else:
+            sig_text = '%s(%s) -> %s()' % (function_name(j), ', '.join(args), ret_type)
+        lines += [
+            '.. erl:function:: %s' % (sig_text,),
+            '',
+        ]
+        if flavored:
+            lines += [
+                '.. erl:function:: %s(%s) @special -> ok' % (function_name(j), ', '.join(args)),
+                '',
+            ]
+        for k in range(arity):
+            lines += [
+                '   :param Arg%d: argument %d.' % (k, k),
+                '   :type  Arg%d: %s:%s()' % (k, module_name(rng.randrange(params.modules)),
+                                             type_name(rng.randrange(max(params.types, 1)))),
+            ]
+        refs = [':erl:func:`%s`' % (xref_target(params, specs, rng),)
+                for _ in range(params.xrefs)]
+        if refs:
+            lines += ['', '   See %s.' % (', '.join(refs),)]
+        lines += ['']
+
+    return '\n'.join(lines) + '\n'
+
+
+def generate_project(srcdir, params):
+    """
+    Write conf.py, index.rst and one document per module into `srcdir`.
+    """
+    specs = function_specs(params)
+    rng = random.Random(params.seed)
+    if not os.path.isdir(srcdir):
+        os.makedirs(srcdir)
+
+    with open(os.path.join(srcdir, 'conf.py'), 'w') as fp:
+        fp.write(CONF_PY)
+
+    with open(os.path.join(srcdir, 'index.rst'), 'w') as fp:
+        fp.write('Synthetic\n=========\n\n.. toctree::\n   :maxdepth: 1\n\n')
+        for i in range(params.modules):
+            fp.write('   %s\n' % (module_name(i),))
+
+    for i in range(params.modules):
+        with open(os.path.join(srcdir, module_name(i) + '.rst'), 'w') as fp:
+            fp.write(generate_module(params, specs, rng, i))
+
+
+def touch_module(srcdir, i):
+    """
+    Change the text of module i, for incremental rebuilds.
+    """
+    path = os.path.join(srcdir, module_name(i) + '.rst')
+    with open(path, 'a') as fp:
+        fp.write('\nChanged.\n')
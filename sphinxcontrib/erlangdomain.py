@@ -13,15 +13,41 @@ from docutils.nodes import Node
 from sphinx.environment import BuildEnvironment
 from docutils.parsers.rst.states import Inliner
 
+import bisect
+import concurrent.futures
 import copy
+import functools
+import glob
+import gzip
+import hashlib
+import inspect
+import json
+import mmap
+import multiprocessing
+import os
+import pickle
+import posixpath
 from distutils.version import LooseVersion, StrictVersion
 from pkg_resources import get_distribution
 import re
 import string
+import struct
 import sys
+import textwrap
+import time
+import zlib
+from html import entities as html_entities
+from xml.etree import ElementTree
+
+try:
+    import sqlite3
+except ImportError:
+    # python built without sqlite.
+    sqlite3 = None
 
 from docutils import nodes
 from docutils.parsers.rst import directives
+from docutils.statemachine import ViewList
 
 from sphinx import addnodes
 from sphinx.roles import XRefRole
@@ -46,6 +72,8 @@ from sphinx.util.docfields import Field, GroupedField, TypedField
 # +---+--------------------+-------+-------------+----------+-----------------+
 # | 8 | .. module::        | (n/a) | module      | (n/a)    | :mod:`...`      |
 # | 9 | .. currentmodule:: | (n/a) | (n/a)       | (n/a)    | (n/a)           |
+# |10 | .. automodule::    | (n/a) | (n/a)       | (n/a)    | (n/a)           |
+# |11 | .. docgen::        | (n/a) | (n/a)       | (n/a)    | (n/a)           |
 # +===+====================+=======+=============+==========+=================+
 #
 # (*1) namespace. same grouping as role.
@@ -125,6 +153,25 @@ RE_FULLNAME = re.compile( r'''
     \Z
     ''', re.VERBOSE)
 
+# names in inventories written by get_objects, other than variants.
+RE_INVENTORY_NAME = re.compile( r'''
+    ^
+    (?P<modname> [a-z]\w*|'[-\w.]+')
+    :
+    (?P<name> [a-zA-Z_]\w*|'[-\w.]+')
+    (?: [/] (?P<arity>\d+) (?:[.][.](?P<arity_max>\d+))? )?
+    (?: [@] (?P<flavor> [a-z]\w*|'[-\w.]+') )?
+    \Z
+    ''', re.VERBOSE)
+
+# lookup names with arity, looked up in arity intervals by
+# ErlangDomain._lookup_arity_name.
+RE_ARITY_NAME = re.compile(r'(?P<name>.+)/(?P<arity>\d+)(?:@(?P<flavor>[^/@]+))?\Z')
+
+RE_VARIABLE = re.compile(r'[A-Z_]\w*\Z')
+
+RE_FLAVOR_SUFFIX = re.compile(r'@.*\Z')
+
 RE_DROP_IMPLICIT_FLAVOR = re.compile( r'''
     \s*
     \[ \s* [@] \s* (?P<implicit_flavor> [a-zA-Z_]\w*|'[-\w.]+') \s* \] \s*
@@ -170,6 +217,14 @@ else:
     def _warn(env, fmt, *args, **kwargs):
         logger.warn(fmt, *args, **kwargs)
 
+if hasattr(nodes.Node, 'findall'):
+    def _findall(node, cls):
+        return node.findall(cls)
+else:
+    # docutils 0.17 and prior.
+    def _findall(node, cls):
+        return node.traverse(cls)
+
 if _SPHINX_VERSION < LooseVersion('4.1.0'):
     def make_xrefs_wrap(self, *args, inliner: Any = None, location: Any = None, **kw) -> List[Node]:
         return self.make_xrefs(*args, **kw)
@@ -180,12 +235,133 @@ else:
 # }}} compat.
 
 
+# {{{ profiling.
+
+class ErlangProfiler:
+    """
+    Call counts, cumulative times and cache hit counts of the domain,
+    collected when ``erl_profile`` is enabled.
+    """
+
+    def __init__(self, main_pid=None):
+        self.main_pid = main_pid or os.getpid()
+        self.timers   = {} # name -> [calls, seconds]
+        self.counters = {} # name -> count
+        self.signature_base = _parse_signature.cache_info()
+
+    def is_main_process(self):
+        return os.getpid() == self.main_pid
+
+    def add_time(self, name, seconds):
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = [0, 0.0]
+        timer[0] += 1
+        timer[1] += seconds
+
+    def count(self, name):
+        self.counters[name] = self.counters.get(name, 0) + 1
+
+    def snapshot(self):
+        info = _parse_signature.cache_info()
+        counters = dict(self.counters)
+        for (name, value, base) in (('signature_cache.hits',   info.hits,   self.signature_base.hits),
+                                    ('signature_cache.misses', info.misses, self.signature_base.misses)):
+            counters[name] = counters.get(name, 0) + value - base
+        return {
+            'timers'  : dict((name, list(timer)) for (name, timer) in _iteritems(self.timers)),
+            'counters': counters,
+        }
+
+    def merge(self, snapshot):
+        # merges a snapshot of a child process.
+        for (name, (calls, seconds)) in _iteritems(snapshot['timers']):
+            timer = self.timers.setdefault(name, [0, 0.0])
+            timer[0] += calls
+            timer[1] += seconds
+        for (name, value) in _iteritems(snapshot['counters']):
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self):
+        snapshot = self.snapshot()
+        counters = snapshot['counters']
+        caches = {}
+        for cache_name in set(name.rsplit('.', 1)[0] for name in counters):
+            hits   = counters.get(cache_name + '.hits', 0)
+            misses = counters.get(cache_name + '.misses', 0)
+            caches[cache_name] = {
+                'hits'    : hits,
+                'misses'  : misses,
+                'hit_rate': hits / (hits + misses) if hits + misses else None,
+            }
+        return {
+            'timers': dict((name, {'calls': calls, 'seconds': round(seconds, 6)})
+                           for (name, (calls, seconds)) in sorted(_iteritems(snapshot['timers']))),
+            'caches': caches,
+        }
+
+# set by on_builder_inited when erl_profile is enabled.
+_profiler = None
+
+def _reset_profiler_after_fork():
+    # forked to read documents in parallel. counts of the parent are not
+    # sent back.
+    if _profiler is not None:
+        _profiler.__init__(_profiler.main_pid)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_profiler_after_fork)
+
+def _profiled(func):
+    # records calls and time of func into _profiler. for generators, the time
+    # to produce items is recorded. installed by _install_profiler.
+    name = func.__qualname__
+
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def gen_wrapper(*args, **kwargs):
+            profiler = _profiler
+            elapsed = 0.0
+            start = time.perf_counter()
+            try:
+                for item in func(*args, **kwargs):
+                    elapsed += time.perf_counter() - start
+                    yield item
+                    start = time.perf_counter()
+                elapsed += time.perf_counter() - start
+            finally:
+                profiler.add_time(name, elapsed)
+        return gen_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profiler = _profiler
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.add_time(name, time.perf_counter() - start)
+    return wrapper
+
+def _count(name):
+    if _profiler is not None:
+        _profiler.count(name)
+
+# }}} profiling.
+
+
 class ErlangObjectContext:
     def __init__(self, objtype, sigdata):
         self.objtype = objtype
         self.sigdata = sigdata
 
 class ErlangSignature:
+    __slots__ = (
+        'nsname', 'decltype', 'modname', 'sigil', 'name', 'flavor',
+        'explicit_flavor', 'when_text', 'arity', 'arity_max', 'arg_text',
+        'arg_list', 'ret_ann', 'rec_decl',
+    )
+
     @classmethod
     def canon_atom(cls, name):
         return cls.canon_name_(name, RE_ATOM)
@@ -223,19 +399,20 @@ class ErlangSignature:
         self.arity     = d['arity'    ]  # Optional[int]
         self.arity_max = d['arity_max']  # Optional[int]
         self.arg_text  = d['arg_text' ]  # Optional[str]
-        self.arg_list  = d['arg_list' ]  # Optional[List[Tuple[str,str]]]
+        self.arg_list  = d['arg_list' ]  # Optional[Tuple[Tuple[str,str], ...]]
         self.ret_ann   = d['ret_ann'  ]  # Optional[str]
         self.rec_decl  = d['rec_decl' ]  # Optional[str]
 
+        # module and atom names are interned to be shared among entries.
         if self.modname is not None:
-            self.modname = self.canon_atom(self.modname)
+            self.modname = sys.intern(self.canon_atom(self.modname))
         if nsname == 'macro':
-            self.name = self.canon_name(self.name)
+            self.name = sys.intern(self.canon_name(self.name))
         else:
-            self.name = self.canon_atom(self.name)
+            self.name = sys.intern(self.canon_atom(self.name))
 
         if self.flavor is not None:
-            self.flavor = self.canon_atom(self.flavor)
+            self.flavor = sys.intern(self.canon_atom(self.flavor))
 
         # check constraint on sigil.
         if self.sigil:
@@ -251,6 +428,8 @@ class ErlangSignature:
 
         # compute arity.
         if self.arg_list is not None:
+            # shared between copies of a memoized signature.
+            self.arg_list = tuple(self.arg_list)
             self.arity = len(list(filter(lambda arg: arg[0] == 'mandatory', self.arg_list)))
             if self.arity == len(self.arg_list):
                 self.arity_max = None
@@ -287,14 +466,35 @@ class ErlangSignature:
                 raise ValueError
 
 
+    # pickled as a tuple of the values of __slots__, without their names.
+    # bump ErlangDomain.data_version when __slots__ is changed.
+    def __getstate__(self):
+        return (self.nsname, self.decltype, self.modname, self.sigil, self.name, self.flavor,
+                self.explicit_flavor, self.when_text, self.arity, self.arity_max,
+                self.arg_text, self.arg_list, self.ret_ann, self.rec_decl)
+
+    def __setstate__(self, state):
+        (self.nsname, self.decltype, self.modname, self.sigil, self.name, self.flavor,
+         self.explicit_flavor, self.when_text, self.arity, self.arity_max,
+         self.arg_text, self.arg_list, self.ret_ann, self.rec_decl) = state
+
     @classmethod
     def from_text(cls, sig_text, nsname, decltype=None):
         # (str, nsname, Optional[decltype]) -> ErlangSignature
-        res = ErlangSignatureParser.run(sig_text)
-        return cls(nsname, res.to_dict(), decltype)
+        # parse results are memoized and shared. return a copy since callers
+        # may fill in modname and flavor.
+        sigdata = _parse_signature(sig_text, nsname, decltype)
+        if sigdata is None:
+            raise ValueError
+        return copy.copy(sigdata)
+
+    @staticmethod
+    def cache_info():
+        # () -> functools._CacheInfo(hits, misses, maxsize, currsize)
+        return _parse_signature.cache_info()
 
 
-    def to_disp_name(self):
+    def to_disp_name(self, with_flavor=True):
         if self.modname is None:
             modname = ''
         else:
@@ -303,7 +503,7 @@ class ErlangSignature:
         name = self.local_disp_name_()
 
         flavor = ''
-        if self.flavor is not None:
+        if self.flavor is not None and with_flavor:
             flavor = '@%s' % (self.flavor,)
 
         if self.ret_ann is not None:
@@ -381,13 +581,42 @@ class ErlangSignature:
 
     @staticmethod
     def drop_flavor_from_full_name(fullname):
-        return re.compile(r'@.*\Z').sub('', fullname, 1)
+        return RE_FLAVOR_SUFFIX.sub('', fullname, 1)
+
+def _lexeme(regexp, flags=0):
+    # a lexeme followed by whitespaces, which are skipped together.
+    return re.compile(r'(%s)\s*' % (regexp,), flags)
 
 class ErlangSignatureParser:
-    RE_ATOM = re.compile(r"[a-z]\w*|'[-\w.]+'")
-    RE_NAME = re.compile(r"[A-Za-z_]\w*|'[-\w.]+'")
+    RE_ATOM = _lexeme(r"[a-z]\w*|'[-\w.]+'")
+    RE_NAME = _lexeme(r"[A-Za-z_]\w*|'[-\w.]+'")
     RE_WS   = re.compile(r'\s*')
 
+    # all tokens in a single pass. the alternatives are tried in order.
+    RE_TOKEN = _lexeme(r'''
+        \[,
+        | [(){}\[\]]
+        | [A-Za-z_]\w*|'[-\w.]+'
+        | \d+
+        | ->|::|[.]{2,}|[-+*/#?$<>=,.:|]
+        ''', re.VERBOSE)
+
+    RE_COLON        = _lexeme(r':')
+    RE_SIGIL        = _lexeme(r'[#?]')
+    RE_LBRACE       = _lexeme(r'[{]')
+    RE_REC_DECL     = re.compile(r'(.*?)\s*[}]\s*[.]?\Z')
+    RE_SLASH        = _lexeme(r'/')
+    RE_DIGITS       = _lexeme(r'\d+')
+    RE_RANGE        = _lexeme(r'[.][.]')
+    RE_LPAREN       = _lexeme(r'[(]')
+    RE_RPAREN       = _lexeme(r'[)]')
+    RE_AT           = _lexeme(r'@')
+    RE_LBRACKET     = _lexeme(r'\[')
+    RE_RBRACKET     = _lexeme(r'\]')
+    RE_WHEN         = _lexeme(r'when\b')
+    RE_ARROW        = _lexeme(r'->')
+    RE_PERIOD       = _lexeme(r'[.]')
+
     # private constructor.
     def __init__(self, text):
         self.text  = text
@@ -430,12 +659,12 @@ class ErlangSignatureParser:
         if m is not None:
             self.pos = m.end(0)
 
-    def consume(self, regexp, required=False):
-        m = re.compile(regexp).match(self.text, self.pos)
+    def consume(self, lexeme, required=False):
+        # lexeme is a pattern from _lexeme.
+        m = lexeme.match(self.text, self.pos)
         if m is not None:
             self.pos = m.end(0)
-            self.skip_ws()
-            return m.group(0)
+            return m.group(1)
         else:
             if required:
                 raise ValueError
@@ -451,22 +680,16 @@ class ErlangSignatureParser:
         return ret
 
     def consume_token(self):
-        m = self.consume('\[,')
-        if m is None:
-            m = self.consume('[(){}\[\]]')
-        if m is None:
-            m = self.consume(self.RE_NAME)
-        if m is None:
-            m = self.consume(r'\d+')
-        if m is None:
-            m = self.consume(r'->|::|[.]{2,}|[-+*/#?$<>=,.:|]')
+        m = self.RE_TOKEN.match(self.text, self.pos)
         if m is None:
             if self.pos != len(self.text):
                 raise ValueError
-        return m
+            return None
+        self.pos = m.end(0)
+        return m.group(1)
 
     def consume_arg_list(self):
-        if self.consume('[)]') is not None:
+        if self.consume(self.RE_RPAREN) is not None:
             self.arg_list = []
             self.arg_text = ''
             return
@@ -558,7 +781,7 @@ class ErlangSignatureParser:
         if tmp_modname is None:
             self.rollback()
         else:
-            if self.consume(':') is None:
+            if self.consume(self.RE_COLON) is None:
                 self.rollback()
             else:
                 self.modname = tmp_modname
@@ -566,37 +789,37 @@ class ErlangSignatureParser:
         del tmp_modname
 
         # sigil and thing name.
-        self.sigil = self.consume('[#?]')
+        self.sigil = self.consume(self.RE_SIGIL)
         self.name = self.consume(self.RE_NAME)
         if self.name is None:
             raise ValueError
 
         # special case for record.
-        if self.consume('[{]') is not None:
-            m = re.compile(r'(.*?)\s*[}]\s*[.]?\Z').match(self.text, self.pos)
+        if self.consume(self.RE_LBRACE) is not None:
+            m = self.RE_REC_DECL.match(self.text, self.pos)
             if m is None:
                 raise ValueError
             self.rec_decl = m.groups(1)
             return self
 
         # fun/callback/type/macro.
-        if self.consume('/') is not None:
-            self.arity = int(self.consume(r'\d+', required=True))
-            if self.consume('[.][.]') is not None:
-                self.arity_max = int(self.consume(r'\d+', required=True))
-        elif self.consume('[(]') is not None:
+        if self.consume(self.RE_SLASH) is not None:
+            self.arity = int(self.consume(self.RE_DIGITS, required=True))
+            if self.consume(self.RE_RANGE) is not None:
+                self.arity_max = int(self.consume(self.RE_DIGITS, required=True))
+        elif self.consume(self.RE_LPAREN) is not None:
             self.consume_arg_list()
         else:
             pass
 
         # flavor.
         self.push_state()
-        if self.consume('@') is not None:
+        if self.consume(self.RE_AT) is not None:
             self.flavor = self.consume(self.RE_ATOM)
             self.explicit_flavor = True
             self.accept()
         else:
-            m = self.consume_all([r'\[', '@', self.RE_ATOM, r'\]'])
+            m = self.consume_all([self.RE_LBRACKET, self.RE_AT, self.RE_ATOM, self.RE_RBRACKET])
             if m is not None:
                 self.flavor = m[2]
                 self.explicit_flavor = False
@@ -604,24 +827,38 @@ class ErlangSignatureParser:
             else:
                 self.rollback()
 
-        if self.consume(r'when\b') is not None:
+        if self.consume(self.RE_WHEN) is not None:
             self.when_text = self.consume_until('->')
             if self.when_text == '':
                 raise ValueError
 
-        if self.consume(r'->') is not None:
+        if self.consume(self.RE_ARROW) is not None:
             self.ret_ann = self.consume_until('.')
             if self.ret_ann == '':
                 raise ValueError
 
         # drop a terminal period if any.
-        self.consume('[.]')
+        self.consume(self.RE_PERIOD)
 
         if self.pos != len(self.text):
             raise ValueError
 
         return self
 
+# the same signatures are parsed over and over, e.g. ``erlang:iodata()`` in
+# every ``:type:`` field. see ErlangSignature.from_text.
+SIGNATURE_CACHE_SIZE = 65536
+
+@functools.lru_cache(maxsize=SIGNATURE_CACHE_SIZE)
+def _parse_signature(sig_text, nsname, decltype):
+    # (str, nsname, Optional[decltype]) -> Optional[ErlangSignature]
+    # returns None for an invalid signature so that it is cached too.
+    try:
+        res = ErlangSignatureParser.run(sig_text)
+        return ErlangSignature(nsname, res.to_dict(), decltype)
+    except ValueError:
+        return None
+
 class ErlangRaisesField(TypedField):
     def make_field(self, types: Dict[str, List[Node]], domain: str,
                    items: Tuple, env: BuildEnvironment = None,
@@ -727,6 +964,8 @@ class ErlangBaseObject(ObjectDescription):
         'type'    : 'ty',
     }
 
+    ROLE_FROM_NAMESPACE = dict((v, k) for (k, v) in _iteritems(NAMESPACE_FROM_ROLE))
+
     @staticmethod
     def namespace_of(objtype):
         return ErlangObject.NAMESPACE_FROM_OBJTYPE[objtype]
@@ -764,9 +1003,9 @@ class ErlangBaseObject(ObjectDescription):
             raise
 
         if sigdata.modname is None:
-            sigdata.modname = self.options.get(
+            sigdata.modname = sys.intern(self.options.get(
                 'module',
-                _ref_context(self.env).get('erl:module', 'erlang'))
+                _ref_context(self.env).get('erl:module', 'erlang')))
         elif 'module' not in self.options:
             pass
         elif self.options['module'] == sigdata.modname:
@@ -866,54 +1105,19 @@ class ErlangBaseObject(ObjectDescription):
         sigdata = self.erl_sigdata
         objname = '%s:%s' % (sigdata.modname, sigdata.name)
         if sigdata.arity_max is not None:
-            arity_range = range(sigdata.arity, sigdata.arity_max + 1)
+            arity_lo, arity_hi = sigdata.arity, sigdata.arity_max
         elif sigdata.arity is not None:
-            arity_range = [sigdata.arity]
+            arity_lo, arity_hi = sigdata.arity, sigdata.arity
         elif sigdata.is_arglist_mandatory():
             # arglist is mandatory. treat as no arguments.
-            arity_range = [0]
+            arity_lo, arity_hi = 0, 0
         else:
             # no arglist portion.
-            arity_range = [None]
-
-        oinv = self.env.domaindata['erl']['objects'][sigdata.nsname]
-        arities = oinv.setdefault(objname, {})
+            arity_lo, arity_hi = None, None
 
         deprecated = 'deprecated' in self.options
-        for arity in arity_range:
-            new_entry = ObjectEntry(self.env.docname, deprecated, sigdata, refname, self.lineno)
-            arities.setdefault(arity, {})
-            if sigdata.flavor not in arities[arity]:
-                # ok. register entry.
-                arities[arity][sigdata.flavor] = new_entry
-
-                if None not in arities[arity]:
-                    s2 = copy.copy(sigdata)
-                    s2.flavor = None
-                    e2 = new_entry.copy(s2)
-                    e2.refname  = 'erl.%s.%s' % (s2.nsname, s2.to_full_name())
-                    arities[arity][None] = e2
-                continue
-
-            # ng. warn duplicate.
-            prev_entry = arities[arity][sigdata.flavor]
-
-            if arity is None:
-                name_tmp = '%s:%s'    % (sigdata.modname, sigdata.name)
-            else:
-                name_tmp = '%s:%s/%d' % (sigdata.modname, sigdata.name, arity)
-            if sigdata.flavor:
-                name_tmp += ' {flavor=%s}' % (sigdata.flavor,)
-            _warn(self.env,
-                'duplicate Erlang %s description of %s, '
-                'other instance in %s line %d.',
-                sigdata.decltype,
-                name_tmp,
-                self.env.doc2path(prev_entry.docname),
-                prev_entry.lineno,
-                location=(self.env.docname, self.lineno))
-        if not arities:
-            del oinv[objname]
+        new_entry = ObjectEntry(self.env.docname, deprecated, sigdata, refname, self.lineno)
+        self.env.get_domain('erl').note_object(objname, arity_lo, arity_hi, new_entry)
 
     def _add_index(self, refname, fullname):
         indextext = self._compute_index_text(fullname)
@@ -1020,19 +1224,11 @@ class ErlangModule(Directive):
         self.state.document.note_explicit_target(targetnode)
 
         if not modname_error:
-            minv = self.env.domaindata['erl']['modules']
-            if modname not in minv:
-                minv[modname] = (
-                    self.env.docname,
-                    self.options.get('synopsis', ''),
-                    self.options.get('platform', ''),
-                    'deprecated' in self.options)
-            else:
-                _warn(self.env,
-                    'duplicate Erlang module name of %s, other instance in %s.',
-                    modname,
-                    self.env.doc2path(minv[modname][0]),
-                    location=(self.env.docname, self.lineno))
+            self.env.get_domain('erl').add_module(modname, (
+                self.env.docname,
+                self.options.get('synopsis', ''),
+                self.options.get('platform', ''),
+                'deprecated' in self.options), self.lineno)
 
         # the synopsis isn't printed; in fact, it is only used in the
         # modindex currently
@@ -1099,21 +1295,26 @@ class ErlangMarker(Directive):
             refname,
         )
 
-        k_inv = env.domaindata['erl']['markers']
-        if marker_name not in k_inv:
-            # seealso: ErlangDomain.get_objects
-            k_inv[marker_name] = k_entry
-
+        env.get_domain('erl').note_marker((modname, marker_name), k_entry)
         return k_entry
 
 
 class MarkerEntry:
+    __slots__ = ('fullname', 'dispname', 'docname', 'refname')
+
     def __init__(self, fullname, dispname, docname, refname):
         self.fullname = fullname
         self.dispname = dispname
         self.docname  = docname
         self.refname  = refname
 
+    # pickled as a tuple, same as ErlangSignature.
+    def __getstate__(self):
+        return (self.fullname, self.dispname, self.docname, self.refname)
+
+    def __setstate__(self, state):
+        (self.fullname, self.dispname, self.docname, self.refname) = state
+
     def to_intersphinx_target(self):
         return (
                 self.fullname,
@@ -1124,6 +1325,1311 @@ class MarkerEntry:
                 1, # '1' means default search priority.
             )
 
+# {{{ erlang sources.
+
+RE_ERL_LEXEME = re.compile(r"""
+      (?P<comment> %[^\n]* )
+    | (?P<string>  "(?:[^"\\]|\\.)*" )
+    | (?P<quoted>  '(?:[^'\\]|\\.)*' )
+    | (?P<char>    \$(?:\\(?:\^.|[0-7]{1,3}|x\{\w+\}|x\w{2}|.)|.) )
+    | (?P<float>   \d+\.\d+ )
+    | (?P<end>     \.(?=\s|%|\Z) )
+    | (?P<other>   [^%"'$.\d]+|. )
+    """, re.VERBOSE | re.DOTALL)
+
+RE_ERL_GROUP = re.compile(r"""
+      "(?:[^"\\]|\\.)*"
+    | '(?:[^'\\]|\\.)*'
+    | \$\\?.
+    | <<|>>|::
+    | [()\[\]{};,]
+    | [^"'$<>:;,()\[\]{}]+
+    | .
+    """, re.VERBOSE | re.DOTALL)
+
+RE_ERL_ATTRIBUTE = re.compile(r'-\s*([a-z]\w*)\s*(.*)\Z', re.DOTALL)
+RE_ERL_HEAD      = re.compile(r"((?:[a-z]\w*|'[^']*')\s*:\s*)?([a-z]\w*|'[^']*')\s*\(", re.DOTALL)
+RE_ERL_EXPORT    = re.compile(r"([a-z]\w*|'[^']*')\s*/\s*(\d+)")
+
+# bump when the result of extract_erlang_source is changed.
+ERLANG_SOURCE_CACHE_VERSION = 3
+
+ERLANG_SOURCE_SUFFIXES = ('.erl', '.hrl', '.beam', '.chunk')
+
+
+def _scan_erlang_forms(text):
+    # yields (lineno, source, form) of each form. comments are kept in the
+    # source and removed from the form.
+    lineno = 1
+    start = None
+    pieces = []
+    for m in RE_ERL_LEXEME.finditer(text):
+        kind = m.lastgroup
+        lexeme = m.group(0)
+        if kind == 'comment':
+            pass
+        elif kind == 'end':
+            if start is not None:
+                yield (start_lineno, text[start:m.end()], ''.join(pieces).strip())
+            start = None
+            pieces = []
+        else:
+            if start is None and not lexeme.isspace():
+                indent = lexeme[:len(lexeme) - len(lexeme.lstrip())]
+                start = m.start() + len(indent)
+                start_lineno = lineno + indent.count('\n')
+            if start is not None:
+                pieces.append(lexeme)
+        lineno += lexeme.count('\n')
+
+
+def _split_erlang(text, sep, maxsplit=-1):
+    # splits text at sep out of any brackets. an unbalanced closing bracket
+    # ends the text.
+    parts = []
+    depth = 0
+    pos = 0
+    for m in RE_ERL_GROUP.finditer(text):
+        tok = m.group(0)
+        if tok in ('(', '[', '{', '<<'):
+            depth += 1
+        elif tok in (')', ']', '}', '>>'):
+            if depth == 0:
+                parts.append(text[pos:m.start()].strip())
+                return parts
+            depth -= 1
+        elif depth == 0 and tok == sep and maxsplit != 0:
+            parts.append(text[pos:m.start()].strip())
+            pos = m.end()
+            maxsplit -= 1
+    parts.append(text[pos:].strip())
+    return parts
+
+
+def _unwrap_erlang(text):
+    # '(X)' -> 'X', for the attribute syntax like '-spec(...).'.
+    if not text.startswith('('):
+        return text
+    depth = 0
+    for m in RE_ERL_GROUP.finditer(text):
+        tok = m.group(0)
+        if tok in ('(', '[', '{', '<<'):
+            depth += 1
+        elif tok in (')', ']', '}', '>>'):
+            depth -= 1
+            if depth == 0:
+                if m.end() == len(text):
+                    return text[1:-1].strip()
+                break
+    return text
+
+
+def _erlang_arity(head):
+    # 'name(A, B) -> ...' -> 2
+    m = RE_ERL_HEAD.match(head)
+    if m is None:
+        return None
+    args = _split_erlang(head[m.end():], ',')
+    if args == ['']:
+        return 0
+    return len(args)
+
+
+def _erlang_signature(sig_text, fallback):
+    # normalizes whitespaces, which must not contain newlines in a directive.
+    sig_text = ' '.join(sig_text.split())
+    try:
+        ErlangSignatureParser.run(sig_text)
+    except (ValueError, IndexError):
+        return (fallback, False)
+    return (sig_text, True)
+
+
+def extract_erlang_source(text):
+    """
+    Extract the module name and the descriptions of ``-spec``, ``-callback``,
+    ``-type``, ``-opaque``, ``-record`` and ``-define`` from an Erlang
+    source.
+
+    The module description is a list of lines of rST, and the objects are
+    tuples of ``(objtype, lineno, signature, deprecated, source, doc)``.
+    ``source`` is the text of the form to be shown with the signature, or
+    None. ``doc`` is a list of lines of rST.
+    """
+    modname = None
+    exports = set()
+    export_all = False
+    objects = []
+
+    for (lineno, source, form) in _scan_erlang_forms(text):
+        m = RE_ERL_ATTRIBUTE.match(form)
+        if m is None:
+            continue
+        (attr, body) = m.groups()
+        body = _unwrap_erlang(body)
+
+        if attr == 'module':
+            modname = body
+        elif attr == 'export':
+            exports.update((name, int(arity)) for (name, arity) in RE_ERL_EXPORT.findall(body))
+        elif attr == 'compile':
+            export_all = export_all or 'export_all' in body
+        elif attr in ('spec', 'callback'):
+            clauses = _split_erlang(body, ';')
+            m = RE_ERL_HEAD.match(clauses[0])
+            if m is None:
+                continue
+            name = m.group(2)
+            arity = _erlang_arity(clauses[0])
+            (sig_text, ok) = _erlang_signature(clauses[0], '%s/%d' % (name, arity))
+            show_source = not ok or len(clauses) > 1
+            if attr == 'spec':
+                objects.append(('function', lineno, sig_text, (name, arity),
+                                source if show_source else None))
+            else:
+                objects.append(('callback', lineno, sig_text, None,
+                                source if show_source else None))
+        elif attr in ('type', 'opaque'):
+            head = _split_erlang(body, '::', 1)[0]
+            m = RE_ERL_HEAD.match(head)
+            if m is None:
+                continue
+            (sig_text, ok) = _erlang_signature(head, '%s/%d' % (m.group(2), _erlang_arity(head)))
+            # the definition of an opaque type is not a part of the interface.
+            show_source = attr == 'type' or not ok
+            objects.append((attr, lineno, sig_text, None, source if show_source else None))
+        elif attr == 'record':
+            parts = _split_erlang(body, ',', 1)
+            if len(parts) != 2:
+                continue
+            (name, fields) = parts
+            (sig_text, ok) = _erlang_signature('#%s%s' % (name, fields), '#%s' % (name,))
+            objects.append(('record', lineno, sig_text, None, source))
+        elif attr == 'define':
+            head = _split_erlang(body, ',', 1)[0]
+            (sig_text, ok) = _erlang_signature('?%s' % (head,), '?%s' % (head.split('(')[0].strip(),))
+            objects.append(('macro', lineno, sig_text, None, source))
+
+    if exports and not export_all:
+        # only exported functions are documented.
+        objects = [obj for obj in objects if obj[3] is None or obj[3] in exports]
+
+    return {
+        'module' : modname,
+        'doc'    : [],
+        'objects': [(objtype, lineno, sig_text, False, source, [])
+                    for (objtype, lineno, sig_text, _mfa, source) in objects],
+    }
+
+
+# {{{ beam docs chunks (EEP-48).
+
+ETF_VERSION = 131
+
+def _etf_atom(buf, pos, size_fmt, encoding):
+    (size,) = struct.unpack_from(size_fmt, buf, pos)
+    pos += struct.calcsize(size_fmt)
+    return (sys.intern(bytes(buf[pos:pos + size]).decode(encoding)), pos + size)
+
+def _etf_big(buf, pos, size_fmt):
+    (size,) = struct.unpack_from(size_fmt, buf, pos)
+    pos += struct.calcsize(size_fmt)
+    sign = buf[pos]
+    value = int.from_bytes(buf[pos + 1:pos + 1 + size], 'little')
+    return (-value if sign else value, pos + 1 + size)
+
+def _etf_tuple(buf, pos, size_fmt):
+    (size,) = struct.unpack_from(size_fmt, buf, pos)
+    pos += struct.calcsize(size_fmt)
+    elems = []
+    for _ in range(size):
+        (elem, pos) = _etf_decode(buf, pos)
+        elems.append(elem)
+    return (tuple(elems), pos)
+
+def _etf_list(buf, pos):
+    (size,) = struct.unpack_from('>I', buf, pos)
+    pos += 4
+    elems = []
+    for _ in range(size):
+        (elem, pos) = _etf_decode(buf, pos)
+        elems.append(elem)
+    # drop the tail, which is [] for proper lists.
+    (_tail, pos) = _etf_decode(buf, pos)
+    return (elems, pos)
+
+def _etf_map(buf, pos):
+    (size,) = struct.unpack_from('>I', buf, pos)
+    pos += 4
+    d = {}
+    for _ in range(size):
+        (key, pos) = _etf_decode(buf, pos)
+        (value, pos) = _etf_decode(buf, pos)
+        if isinstance(key, list):
+            key = tuple(key)
+        d[key] = value
+    return (d, pos)
+
+def _etf_binary(buf, pos):
+    (size,) = struct.unpack_from('>I', buf, pos)
+    return (bytes(buf[pos + 4:pos + 4 + size]), pos + 4 + size)
+
+def _etf_string(buf, pos):
+    (size,) = struct.unpack_from('>H', buf, pos)
+    return (list(buf[pos + 2:pos + 2 + size]), pos + 2 + size)
+
+def _etf_compressed(buf, pos):
+    (_size,) = struct.unpack_from('>I', buf, pos)
+    data = memoryview(zlib.decompress(buf[pos + 4:]))
+    # a compressed term takes the rest of the buffer.
+    return (_etf_decode(data, 0)[0], len(buf))
+
+# tag -> (buf, pos after tag) -> (term, next pos)
+#   atoms -> str, binaries -> bytes, strings and lists -> list,
+#   tuples -> tuple, maps -> dict.
+_ETF_DECODERS = {
+    97 : lambda buf, pos: (buf[pos], pos + 1),                                   # SMALL_INTEGER_EXT
+    98 : lambda buf, pos: (struct.unpack_from('>i', buf, pos)[0], pos + 4),      # INTEGER_EXT
+    70 : lambda buf, pos: (struct.unpack_from('>d', buf, pos)[0], pos + 8),      # NEW_FLOAT_EXT
+    100: lambda buf, pos: _etf_atom(buf, pos, '>H', 'latin-1'),                  # ATOM_EXT
+    115: lambda buf, pos: _etf_atom(buf, pos, '>B', 'latin-1'),                  # SMALL_ATOM_EXT
+    118: lambda buf, pos: _etf_atom(buf, pos, '>H', 'utf-8'),                    # ATOM_UTF8_EXT
+    119: lambda buf, pos: _etf_atom(buf, pos, '>B', 'utf-8'),                    # SMALL_ATOM_UTF8_EXT
+    104: lambda buf, pos: _etf_tuple(buf, pos, '>B'),                            # SMALL_TUPLE_EXT
+    105: lambda buf, pos: _etf_tuple(buf, pos, '>I'),                            # LARGE_TUPLE_EXT
+    106: lambda buf, pos: ([], pos),                                             # NIL_EXT
+    107: _etf_string,                                                            # STRING_EXT
+    108: _etf_list,                                                              # LIST_EXT
+    109: _etf_binary,                                                            # BINARY_EXT
+    110: lambda buf, pos: _etf_big(buf, pos, '>B'),                              # SMALL_BIG_EXT
+    111: lambda buf, pos: _etf_big(buf, pos, '>I'),                              # LARGE_BIG_EXT
+    116: _etf_map,                                                               # MAP_EXT
+    80 : _etf_compressed,                                                        # compressed term
+}
+
+def _etf_decode(buf, pos):
+    decoder = _ETF_DECODERS.get(buf[pos])
+    if decoder is None:
+        raise ValueError('unsupported external term tag %d' % (buf[pos],))
+    return decoder(buf, pos + 1)
+
+
+def decode_external_term(buf):
+    """
+    Decode a term in the external term format of Erlang, e.g. the output of
+    ``term_to_binary/1``.
+
+    Only the types which appear in documentation chunks are supported.
+    """
+    buf = memoryview(buf)
+    if len(buf) == 0 or buf[0] != ETF_VERSION:
+        raise ValueError('not an external term')
+    return _etf_decode(buf, 1)[0]
+
+
+def iter_beam_chunks(buf):
+    """
+    Yield ``(chunk_id, data)`` of each chunk of a ``.beam`` file.
+    ``data`` is a slice of ``buf``.
+    """
+    buf = memoryview(buf)
+    if bytes(buf[0:4]) != b'FOR1' or bytes(buf[8:12]) != b'BEAM':
+        raise ValueError('not a beam file')
+    (size,) = struct.unpack_from('>I', buf, 4)
+    end = min(len(buf), 8 + size)
+    pos = 12
+    while pos + 8 <= end:
+        chunk_id = bytes(buf[pos:pos + 4]).decode('latin-1')
+        (size,) = struct.unpack_from('>I', buf, pos + 4)
+        yield (chunk_id, buf[pos + 8:pos + 8 + size])
+        # chunks are aligned to 4 bytes.
+        pos += 8 + ((size + 3) & ~3)
+
+
+def _beam_module_name(data):
+    # the first atom of the atom table is the module name.
+    (count,) = struct.unpack_from('>i', data, 0)
+    if count < 0:
+        # compact atom sizes since OTP 28.
+        return None
+    size = data[4]
+    return bytes(data[5:5 + size]).decode('utf-8')
+
+
+def _doc_text(doc):
+    # doc :: #{Lang => Content} | none | hidden
+    if not isinstance(doc, dict) or not doc:
+        return None
+    return doc.get(b'en', next(iter(doc.values())))
+
+
+RE_RST_SPECIAL   = re.compile(r'([\\*`|_])')
+RE_MARKUP_START  = re.compile(r'(?<=\S)\x00')
+RE_MARKUP_END    = re.compile(r'\x01(?=\S)')
+
+def _join_inline(text):
+    # \x00 and \x01 mark the start and the end of inline markup. escaped
+    # spaces are put between markup and adjacent characters.
+    text = RE_MARKUP_START.sub(r'\\ ', text)
+    text = RE_MARKUP_END.sub(r'\\ ', text)
+    return text.replace('\x00', '').replace('\x01', '')
+
+RE_ROLE_TITLE    = re.compile(r'([\\`<>])')
+
+HTML_BLOCK_TAGS = frozenset([
+    'p', 'div', 'pre', 'ul', 'ol', 'li', 'dl', 'dt', 'dd', 'blockquote',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'table', 'tr', 'td', 'th',
+    'note', 'warning',
+])
+
+# erlang+html content is a list of text and (tag, attrs, content) elements.
+# texts are binaries in documentation chunks, and strs from erl_docgen XML.
+
+def _html_str(text):
+    if isinstance(text, bytes):
+        return text.decode('utf-8')
+    return text
+
+def _html_attr(attrs, name):
+    for (key, value) in attrs:
+        if key == name:
+            return _html_str(value)
+    return None
+
+def _html_text(content):
+    # raw text of elements.
+    pieces = []
+    for elem in content:
+        if isinstance(elem, (bytes, str)):
+            pieces.append(_html_str(elem))
+        elif isinstance(elem, tuple) and len(elem) == 3:
+            pieces.append(_html_text(elem[2]))
+    return ''.join(pieces)
+
+def _erlang_link_target(href, rel):
+    # 'app:mod#anchor' of erl_docgen -> (role, target), or None.
+    kind = rel.rsplit('/', 1)[-1] if rel else 'seealso'
+    (app_mod, _sharp, anchor) = href.partition('#')
+    modname = app_mod.rsplit(':', 1)[-1]
+    prefix = modname + ':' if modname else ''
+    if kind == 'seemfa':
+        return ('func', prefix + anchor)
+    if kind == 'seetype':
+        if anchor.startswith('type-'):
+            anchor = anchor[len('type-'):]
+        return ('type', prefix + anchor)
+    if kind not in ('seeerl', 'seealso'):
+        # guides, applications, C references, etc.
+        return None
+    if not anchor:
+        return ('mod', modname) if modname else None
+    m = re.match(r'type-(\w+)\Z', anchor)
+    if m is not None:
+        return ('type', prefix + m.group(1))
+    m = re.match(r'(\w+)[-/](\d+)\Z', anchor)
+    if m is not None:
+        return ('func', '%s%s/%s' % (prefix, m.group(1), m.group(2)))
+    return ('seealso', prefix + anchor)
+
+def _html_link(attrs, children):
+    href = _html_attr(attrs, 'href') or _html_attr(attrs, 'marker') or ''
+    title = ' '.join(_html_text(children).split())
+    if re.match(r'[a-z]+://', href):
+        return '\x00`%s <%s>`__\x01' % (RE_ROLE_TITLE.sub(r'\\\1', title or href), href)
+    target = _erlang_link_target(href, _html_attr(attrs, 'rel'))
+    if target is None:
+        return _html_inline(children)
+    (role, target) = target
+    if not title:
+        return '\x00:erl:%s:`%s`\x01' % (role, target)
+    return '\x00:erl:%s:`%s <%s>`\x01' % (role, RE_ROLE_TITLE.sub(r'\\\1', title), target)
+
+def _html_inline(content):
+    pieces = []
+    for elem in content:
+        if isinstance(elem, (bytes, str)):
+            pieces.append(RE_RST_SPECIAL.sub(r'\\\1', _html_str(elem)))
+            continue
+        if not (isinstance(elem, tuple) and len(elem) == 3):
+            continue
+        (tag, attrs, children) = elem
+        if tag == 'a':
+            pieces.append(_html_link(attrs, children))
+        elif tag == 'marker':
+            pieces.append('\x00:erl:marker:`%s`\x01' % (_html_attr(attrs, 'id'),))
+        elif tag == 'code':
+            text = ' '.join(_html_text(children).split())
+            if text:
+                pieces.append('\x00``%s``\x01' % (text,))
+        elif tag in ('em', 'i'):
+            text = _html_inline(children).strip()
+            if text:
+                pieces.append('\x00*%s*\x01' % (text,))
+        elif tag in ('strong', 'b'):
+            text = _html_inline(children).strip()
+            if text:
+                pieces.append('\x00**%s**\x01' % (text,))
+        elif tag == 'br':
+            pieces.append(' ')
+        else:
+            pieces.append(_html_inline(children))
+    return ' '.join(''.join(pieces).split())
+
+def _html_blocks(content):
+    # erlang+html content -> lines of rST.
+    lines = []
+    inline = []
+
+    def flush():
+        text = _join_inline(_html_inline(inline))
+        if text:
+            lines.extend([text, ''])
+        del inline[:]
+
+    for elem in content:
+        if not (isinstance(elem, tuple) and len(elem) == 3 and elem[0] in HTML_BLOCK_TAGS):
+            inline.append(elem)
+            continue
+        flush()
+        (tag, attrs, children) = elem
+        if tag == 'pre':
+            lines.extend(['.. code-block:: erlang', ''])
+            lines.extend('   ' + line if line else ''
+                         for line in _html_text(children).strip('\n').splitlines())
+            lines.append('')
+        elif tag in ('ul', 'ol'):
+            bullet = '* ' if tag == 'ul' else '#. '
+            for item in children:
+                if isinstance(item, tuple) and len(item) == 3:
+                    item_lines = _html_blocks(item[2]) or ['']
+                    lines.append(bullet + item_lines[0])
+                    lines.extend(' ' * len(bullet) + line if line else ''
+                                 for line in item_lines[1:])
+            lines.append('')
+        elif tag == 'dt':
+            lines.append(_join_inline(_html_inline(children)))
+        elif tag == 'dd':
+            lines.extend('   ' + line if line else '' for line in _html_blocks(children))
+            lines.append('')
+        elif tag in ('h1', 'h2', 'h3', 'h4', 'h5', 'h6'):
+            # sections are not allowed in descriptions.
+            lines.extend(['.. rubric:: %s' % (_join_inline(_html_inline(children)),), ''])
+        elif tag in ('note', 'warning'):
+            lines.extend(['.. %s::' % (tag,), ''])
+            lines.extend('   ' + line if line else '' for line in _html_blocks(children))
+        else:
+            lines.extend(_html_blocks(children))
+    flush()
+    return lines
+
+
+# markdown content is of OTP 27 and later, written for ExDoc.
+
+RE_MARKDOWN_FENCE   = re.compile(r'( *)(`{3,}|~{3,})\s*([\w+-]*)')
+RE_MARKDOWN_HEADING = re.compile(r' {0,3}#{1,6}\s+(.*?)(?:\s+#+)?\s*\Z')
+RE_MARKDOWN_SETEXT  = re.compile(r' {0,3}(?:=+|-+)\s*\Z')
+RE_MARKDOWN_BREAK   = re.compile(r' {0,3}([-*_])(?:\s*\1){2,}\s*\Z')
+RE_MARKDOWN_ITEM    = re.compile(r'( *(?:[-*+]|\d{1,9}[.)]) +)(\S.*)\Z')
+RE_MARKDOWN_QUOTE   = re.compile(r'( {0,3})> ?(.*)\Z')
+RE_MARKDOWN_RULE    = re.compile(r'\s*\|?\s*:?-+:?\s*(?:\|\s*:?-+:?\s*)*\|?\s*\Z')
+RE_MARKDOWN_COMMENT = re.compile(r'\s*<!--.*-->\s*\Z')
+RE_MARKDOWN_ATTRS   = re.compile(r'\s*\{:([^}]*)\}\s*\Z')
+RE_MARKDOWN_REF     = re.compile(r'(?:([mtc]):)?((?:[a-z]\w*:)?[a-z]\w*(?:/\d+)?)\Z')
+RE_MARKDOWN_INLINE  = re.compile(r"""
+      (?P<ticks>`+)\s*(?P<code>.+?)\s*(?P=ticks)(?!`)
+    | (?P<image>!)?\[(?P<text>[^\]]*)\]\((?P<target>[^)\s]*)(?:\s+"[^"]*")?\)
+    | <(?P<url>[a-z][a-z0-9+.-]*://[^>\s]+)>
+    | (?P<strong>\*\*|(?<!\w)__)(?P<strong_text>\S(?:.*?\S)?)(?P=strong)
+    | (?P<em>\*|(?<!\w)_)(?P<em_text>\S(?:.*?\S)?)(?P=em)
+    | \\(?P<escaped>[!-/:-@\[-`{-~])
+    """, re.VERBOSE)
+
+# prefix of ExDoc autolinks -> role.
+MARKDOWN_REF_ROLES = {
+    'm': 'mod',
+    't': 'type',
+    'c': 'callback',
+}
+
+# class of ExDoc admonitions, '> #### Title {: .info }' -> class of rST.
+MARKDOWN_ADMONITIONS = {
+    'info'   : 'note',
+    'tip'    : 'tip',
+    'warning': 'warning',
+    'error'  : 'error',
+    'neutral': None,
+}
+
+def _rst_escape(text):
+    return RE_RST_SPECIAL.sub(r'\\\1', text)
+
+def _markdown_ref(text):
+    # 'm:mod', 't:type/0', 'c:mod:cb/1' or 'mod:fun/1' -> (role, target),
+    # or None.
+    m = RE_MARKDOWN_REF.match(text)
+    if m is None:
+        return None
+    (prefix, target) = m.groups()
+    if prefix is not None:
+        return (MARKDOWN_REF_ROLES[prefix], target)
+    if '/' in target:
+        return ('func', target)
+    return None
+
+def _markdown_link(text, target, image):
+    title = ' '.join(text.split())
+    if image:
+        return _rst_escape(title)
+    if re.match(r'[a-z][a-z0-9+.-]*://', target):
+        return '\x00`%s <%s>`__\x01' % (RE_ROLE_TITLE.sub(r'\\\1', title or target), target)
+    ref = None
+    if len(target) > 2 and target[0] == '`' and target[-1] == '`':
+        ref = _markdown_ref(target[1:-1])
+    if ref is None:
+        # guides, anchors, other applications, etc.
+        return _markdown_inline(title)
+    (role, target) = ref
+    title = title.replace('`', '')
+    if not title or title == target:
+        return '\x00:erl:%s:`%s`\x01' % (role, target)
+    return '\x00:erl:%s:`%s <%s>`\x01' % (role, RE_ROLE_TITLE.sub(r'\\\1', title), target)
+
+def _markdown_inline(text):
+    # -> rST, with \x00 and \x01 around inline markup, see _join_inline.
+    pieces = []
+    pos = 0
+    for m in RE_MARKDOWN_INLINE.finditer(text):
+        pieces.append(_rst_escape(text[pos:m.start()]))
+        pos = m.end()
+        if m.group('ticks'):
+            code = m.group('code')
+            ref = RE_MARKDOWN_REF.match(code)
+            if ref is not None and ref.group(1) is not None:
+                # autolink with a prefix, e.g. `m:lists`.
+                pieces.append('\x00:erl:%s:`%s`\x01' % (
+                    MARKDOWN_REF_ROLES[ref.group(1)], ref.group(2)))
+            else:
+                pieces.append('\x00``%s``\x01' % (code,))
+        elif m.group('target') is not None:
+            pieces.append(_markdown_link(m.group('text'), m.group('target'), m.group('image')))
+        elif m.group('url'):
+            url = m.group('url')
+            pieces.append('\x00`%s <%s>`__\x01' % (RE_ROLE_TITLE.sub(r'\\\1', url), url))
+        elif m.group('strong'):
+            pieces.append('\x00**%s**\x01' % (_rst_escape(m.group('strong_text')),))
+        elif m.group('em'):
+            pieces.append('\x00*%s*\x01' % (_rst_escape(m.group('em_text')),))
+        else:
+            pieces.append(_rst_escape(m.group('escaped')))
+    pieces.append(_rst_escape(text[pos:]))
+    return ''.join(pieces)
+
+def _markdown_indent(indent, lines):
+    return [indent + line if line else '' for line in lines]
+
+def _markdown_to_rst(text):
+    # markdown -> lines of rST. sections are not allowed in descriptions,
+    # headings are rubrics as of erlang+html.
+    src = text.splitlines()
+    lines = []
+    para = []       # prefix of the first line, and texts of the paragraph.
+    in_list = False
+
+    def flush():
+        if para:
+            text = _join_inline(_markdown_inline(' '.join(para[1:])))
+            if text.endswith('::'):
+                # not a literal block.
+                text = text[:-1] + '\\:'
+            lines.append(para[0] + text)
+            del para[:]
+
+    def blank():
+        flush()
+        if lines and lines[-1]:
+            lines.append('')
+
+    i = 0
+    while i < len(src):
+        line = src[i].rstrip()
+        i += 1
+        indent = line[:len(line) - len(line.lstrip())]
+        if not line:
+            blank()
+            continue
+        if RE_MARKDOWN_COMMENT.match(line):
+            continue
+
+        m = RE_MARKDOWN_FENCE.match(line)
+        if m is not None:
+            (indent, fence, lang) = m.groups()
+            blank()
+            lines.extend([indent + '.. code-block:: %s' % (lang or 'erlang',), ''])
+            while i < len(src) and not src[i].lstrip().startswith(fence):
+                code = src[i].rstrip()
+                code = code[min(len(indent), len(code) - len(code.lstrip())):]
+                lines.append(indent + '   ' + code if code else '')
+                i += 1
+            i += 1
+            blank()
+            continue
+
+        if para and RE_MARKDOWN_SETEXT.match(line):
+            title = ' '.join(para[1:])
+            del para[:]
+            blank()
+            lines.extend(['.. rubric:: %s' % (_join_inline(_markdown_inline(title)),), ''])
+            continue
+        if RE_MARKDOWN_BREAK.match(line):
+            blank()
+            continue
+
+        m = RE_MARKDOWN_HEADING.match(line)
+        if m is not None:
+            title = RE_MARKDOWN_ATTRS.sub('', m.group(1))
+            blank()
+            lines.extend(['.. rubric:: %s' % (_join_inline(_markdown_inline(title)),), ''])
+            continue
+
+        m = RE_MARKDOWN_QUOTE.match(line)
+        if m is not None:
+            quote = [m.group(2)]
+            while i < len(src) and RE_MARKDOWN_QUOTE.match(src[i]):
+                quote.append(RE_MARKDOWN_QUOTE.match(src[i]).group(2))
+                i += 1
+            blank()
+            lines.extend(_markdown_quote(m.group(1), quote))
+            blank()
+            continue
+
+        if '|' in line and i < len(src) and RE_MARKDOWN_RULE.match(src[i]):
+            # tables are shown as they are.
+            blank()
+            lines.extend([indent + '::', ''])
+            while True:
+                lines.append(indent + '   ' + line)
+                if i >= len(src) or '|' not in src[i]:
+                    break
+                line = src[i].rstrip()
+                i += 1
+            blank()
+            continue
+
+        m = RE_MARKDOWN_ITEM.match(line)
+        if m is not None:
+            blank()
+            para.extend(m.groups())
+            in_list = True
+            continue
+
+        if para:
+            # continuation of the paragraph, may be lazy.
+            para.append(line.strip())
+            continue
+
+        if len(indent) >= 4 and not in_list:
+            # indented code block.
+            blank()
+            lines.extend(['::', ''])
+            i -= 1
+            while i < len(src) and (not src[i].strip() or src[i].startswith('    ')):
+                lines.append('   ' + src[i][4:].rstrip() if src[i].strip() else '')
+                i += 1
+            blank()
+            continue
+
+        if not indent:
+            in_list = False
+        para.extend([indent, line.strip()])
+
+    blank()
+    return lines
+
+def _markdown_quote(indent, quote):
+    # lines of a block quote -> lines of rST, an admonition of ExDoc or a
+    # block quote.
+    title = RE_MARKDOWN_HEADING.match(quote[0])
+    attrs = title and RE_MARKDOWN_ATTRS.search(title.group(1))
+    classes = attrs and [name.lstrip('.') for name in attrs.group(1).split()]
+    if classes and classes[0] in MARKDOWN_ADMONITIONS:
+        lines = ['.. admonition:: %s' % (
+            _join_inline(_markdown_inline(RE_MARKDOWN_ATTRS.sub('', title.group(1)))),)]
+        if MARKDOWN_ADMONITIONS[classes[0]] is not None:
+            lines.append('   :class: %s' % (MARKDOWN_ADMONITIONS[classes[0]],))
+        lines.append('')
+        lines.extend(_markdown_indent('   ', _markdown_to_rst('\n'.join(quote[1:]))))
+    else:
+        # the empty comment ends a preceding directive, whose content would
+        # take the block quote.
+        lines = ['..', ''] + _markdown_indent('   ', _markdown_to_rst('\n'.join(quote)))
+    return _markdown_indent(indent, lines)
+
+
+def _doc_to_rst(fmt, doc):
+    # -> lines of rST.
+    text = _doc_text(doc)
+    if text is None:
+        return []
+    if fmt == b'application/erlang+html':
+        return _html_blocks(text)
+    if isinstance(text, bytes):
+        text = text.decode('utf-8')
+    if fmt == b'text/markdown':
+        return _markdown_to_rst(text)
+    return text.splitlines()
+
+
+def extract_beam_docs(buf, modname=None):
+    """
+    Extract the module name and the descriptions from an EEP-48
+    documentation chunk, in a ``.beam`` file or a ``.chunk`` file.
+
+    The result has the same form as ``extract_erlang_source``.
+    """
+    if bytes(buf[0:2]) == b'\x1f\x8b':
+        # compressed by erlc +compressed.
+        buf = gzip.decompress(buf)
+    buf = memoryview(buf)
+    term = None
+    if bytes(buf[0:4]) == b'FOR1':
+        for (chunk_id, data) in iter_beam_chunks(buf):
+            if chunk_id in ('AtU8', 'Atom'):
+                modname = _beam_module_name(data) or modname
+            elif chunk_id == 'Docs':
+                term = decode_external_term(data)
+    else:
+        term = decode_external_term(buf)
+
+    # {docs_v1, Anno, BeamLanguage, Format, ModuleDoc, Metadata, Docs}
+    if term is None:
+        raise ValueError('no documentation chunk (Docs) in the beam file')
+    if not (isinstance(term, tuple) and len(term) == 7 and term[0] == 'docs_v1'):
+        raise ValueError('unsupported documentation chunk')
+    if term[4] == 'hidden':
+        return {'module': None, 'doc': [], 'objects': []}
+    (_tag, _anno, _lang, fmt, module_doc, _metadata, docs) = term
+
+    objects = []
+    for entry in docs:
+        # {{Kind, Name, Arity}, Anno, Signature, Doc, Metadata}
+        ((kind, name, arity), _anno, signature, doc, metadata) = entry
+        if doc == 'hidden' or kind not in ErlangObject.NAMESPACE_FROM_OBJTYPE:
+            continue
+        sig_text = signature[0].decode('utf-8') if signature else ''
+        (sig_text, _ok) = _erlang_signature(sig_text, '%s/%d' % (name, arity))
+        deprecated = isinstance(metadata, dict) and 'deprecated' in metadata
+        objects.append((kind, 0, sig_text, deprecated, None, _doc_to_rst(fmt, doc)))
+
+    return {
+        'module' : modname,
+        'doc'    : _doc_to_rst(fmt, module_doc),
+        'objects': objects,
+    }
+
+# }}} beam docs chunks (EEP-48).
+
+
+# {{{ erl_docgen xml.
+
+# erl_docgen tag -> erlang+html tag.
+DOCGEN_TAGS = {
+    'c'      : 'code',
+    'code'   : 'pre',
+    'description': 'div',
+    'section': 'div',
+    'title'  : 'h2',
+    'taglist': 'dl',
+    'tag'    : 'dt',
+    'url'    : 'a',
+    'seealso': 'a',
+}
+
+def _docgen_element(elem, parent_tag):
+    tag = elem.tag
+    attrs = list(elem.attrib.items())
+    if tag == 'list':
+        tag = 'ol' if elem.get('type') == 'ordered' else 'ul'
+    elif tag == 'item':
+        tag = 'dd' if parent_tag == 'taglist' else 'li'
+    elif tag.startswith('see') and tag != 'seealso':
+        # seemfa, seetype, seeerl, seeguide, etc. of OTP 24 and later.
+        attrs.append(('rel', tag))
+        tag = 'a'
+    else:
+        tag = DOCGEN_TAGS.get(tag, tag)
+    return (tag, attrs, _docgen_content(elem))
+
+def _docgen_content(elem):
+    # -> erlang+html content of the children of elem.
+    content = []
+    if elem.text:
+        content.append(elem.text)
+    for child in elem:
+        content.append(_docgen_element(child, elem.tag))
+        if child.tail:
+            content.append(child.tail)
+    return content
+
+def _docgen_signature(elem, is_type=False):
+    # <name> -> signature, or None.
+    name = elem.get('name')
+    if name is not None:
+        # generated from specs, which are not in the XML.
+        arity = elem.get('arity', elem.get('n_vars'))
+        if arity is None:
+            return '%s()' % (name,)
+        return '%s/%s' % (name, arity)
+
+    nametext = elem.find('nametext')
+    if nametext is not None:
+        text = ''.join(nametext.itertext())
+        ret = elem.find('ret')
+        if ret is not None:
+            text += ' -> ' + ''.join(ret.itertext())
+    else:
+        text = ''.join(elem.itertext())
+    text = ' '.join(text.split())
+    if is_type:
+        # drop the definition, 'name() = term()'.
+        text = re.split(r'=|::', text, 1)[0].strip()
+
+    m = RE_ERL_HEAD.match(text)
+    if m is None:
+        return None
+    return _erlang_signature(text, '%s/%d' % (m.group(2), _erlang_arity(text)))[0]
+
+def _docgen_indent(lines):
+    return ['   ' + line if line else '' for line in lines]
+
+def _docgen_datatype(elem, options):
+    name = elem.find('name')
+    sig_text = None if name is None else _docgen_signature(name, is_type=True)
+    if sig_text is None:
+        return []
+    lines = ['.. erl:type:: %s' % (sig_text,)] + options + ['']
+    desc = elem.find('desc')
+    if desc is not None:
+        lines.extend(_docgen_indent(_html_blocks(_docgen_content(desc))))
+    return lines
+
+def _docgen_func(elem, options):
+    sigs = []
+    seen = set()
+    for name in elem.findall('name'):
+        sig_text = _docgen_signature(name)
+        if sig_text is None:
+            continue
+        try:
+            res = ErlangSignatureParser.run(sig_text)
+        except ValueError:
+            continue
+        key = (res.name, res.arity if res.arg_list is None else len(res.arg_list))
+        # clauses of the same function are described once.
+        if key not in seen:
+            seen.add(key)
+            sigs.append(sig_text)
+    if not sigs:
+        return []
+
+    lines = ['.. erl:function:: %s' % (sigs[0],)]
+    lines.extend('   %s' % (sig_text,) for sig_text in sigs[1:])
+    lines.extend(options)
+    lines.append('')
+
+    blocks = []
+    for type_elem in elem.findall('type'):
+        # <v>Var = Type</v><d>Description</d>
+        items = []
+        for child in type_elem:
+            if child.tag == 'v':
+                items.append(('li', [], [('code', [], [''.join(child.itertext())])]))
+            elif child.tag == 'd' and items:
+                items[-1][2].append(' ')
+                items[-1][2].extend(_docgen_content(child))
+        if items:
+            blocks.extend(_html_blocks([('ul', [], items)]))
+    desc = elem.find('desc')
+    if desc is not None:
+        blocks.extend(_html_blocks(_docgen_content(desc)))
+    lines.extend(_docgen_indent(blocks))
+    return lines
+
+
+def iter_docgen_xml(source, options=()):
+    """
+    Convert an erl_docgen reference manual (``<erlref>``) into rST.
+
+    The lines of each part, e.g. the description or a function, are yielded
+    as soon as the part is parsed, and the part is dropped from the tree.
+    ``options`` are lines added to every directive, e.g. ``'   :noindex:'``.
+    """
+    options = list(options)
+    parser = ElementTree.XMLParser()
+    # the DTD is not read, but its entities are used.
+    parser.entity.update(html_entities.entitydefs)
+
+    stack = []
+    modname = None
+    for (event, elem) in ElementTree.iterparse(source, events=('start', 'end'), parser=parser):
+        if event == 'start':
+            stack.append(elem)
+            if len(stack) == 2 and elem.tag in ('datatypes', 'funcs'):
+                if modname is not None:
+                    yield ['.. erl:module:: %s' % (modname,)] + options + ['']
+                    modname = None
+                title = 'Data Types' if elem.tag == 'datatypes' else 'Exports'
+                yield ['.. rubric:: %s' % (title,), '']
+            continue
+
+        stack.pop()
+        # parts are children of the root, <datatypes> and <funcs>.
+        if not (len(stack) == 1 or
+                (len(stack) == 2 and stack[1].tag in ('datatypes', 'funcs'))):
+            continue
+
+        if elem.tag == 'module':
+            modname = (elem.text or '').strip()
+        elif elem.tag == 'modulesummary' and modname is not None:
+            synopsis = ' '.join(''.join(elem.itertext()).split())
+            yield ['.. erl:module:: %s' % (modname,), '   :synopsis: %s' % (synopsis,)] + options + ['']
+            modname = None
+        elif elem.tag in ('description', 'section', 'datatype', 'func'):
+            if modname is not None:
+                yield ['.. erl:module:: %s' % (modname,)] + options + ['']
+                modname = None
+            if elem.tag == 'datatype':
+                yield _docgen_datatype(elem, options)
+            elif elem.tag == 'func':
+                yield _docgen_func(elem, options)
+            else:
+                yield _html_blocks([_docgen_element(elem, stack[-1].tag)])
+        stack[-1].remove(elem)
+
+    if modname is not None:
+        yield ['.. erl:module:: %s' % (modname,)] + options + ['']
+
+# }}} erl_docgen xml.
+
+
+def _erlang_source_cache_path(cachedir, checksum):
+    return os.path.join(cachedir, 'v%d-%s.pickle' % (ERLANG_SOURCE_CACHE_VERSION, checksum))
+
+
+def _erlang_source_stamp_path(cachedir, path):
+    # -> path of the stamp of path, keyed by its modification time and size,
+    # which has the checksum of its content. raises OSError if path does not
+    # exist.
+    st = os.stat(path)
+    key = '%s\0%d\0%d' % (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    checksum = hashlib.sha1(key.encode('utf-8', 'surrogateescape')).hexdigest()
+    return os.path.join(cachedir, 'v%d-%s.stamp' % (ERLANG_SOURCE_CACHE_VERSION, checksum))
+
+
+def _read_erlang_source_stamp(cachedir, stamp_path):
+    # -> cache path written in the stamp, or None.
+    try:
+        with open(stamp_path) as f:
+            return _erlang_source_cache_path(cachedir, f.read().strip())
+    except OSError:
+        return None
+
+
+def _read_erlang_source_cache(cache_path):
+    # -> cached result, or None.
+    try:
+        with open(cache_path, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+
+def _write_erlang_source_cache(cache_path, content):
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # renamed at last, as other processes may read the same file.
+        tmp_path = '%s.%d' % (cache_path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+
+
+def load_erlang_source(path, cachedir):
+    """
+    Read an Erlang source file, a beam file or a documentation chunk file,
+    reusing the result of a previous extraction of the same content.
+
+    The content is read and hashed only when the modification time or the
+    size of the file is changed.
+    """
+    stamp_path = _erlang_source_stamp_path(cachedir, path)
+    cache_path = _read_erlang_source_stamp(cachedir, stamp_path)
+    if cache_path is not None:
+        result = _read_erlang_source_cache(cache_path)
+        if result is not None:
+            _count('erlang_source_cache.hits')
+            return result
+
+    with open(path, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file.
+            data = b''
+    try:
+        return _load_erlang_source(path, data, cachedir, stamp_path)
+    finally:
+        if isinstance(data, mmap.mmap):
+            try:
+                data.close()
+            except BufferError:
+                # a view is still alive in a traceback. closed by gc.
+                pass
+
+
+def _load_erlang_source(path, data, cachedir, stamp_path):
+    checksum = hashlib.sha1(data).hexdigest()
+    cache_path = _erlang_source_cache_path(cachedir, checksum)
+    result = _read_erlang_source_cache(cache_path)
+    if result is not None:
+        # same content with another modification time.
+        _count('erlang_source_cache.hits')
+    else:
+        _count('erlang_source_cache.misses')
+        if path.endswith(('.beam', '.chunk')):
+            modname = os.path.splitext(os.path.basename(path))[0]
+            result = extract_beam_docs(data, modname)
+        else:
+            result = extract_erlang_source(bytes(data).decode('utf-8', 'replace'))
+        _write_erlang_source_cache(cache_path, pickle.dumps(result, pickle.HIGHEST_PROTOCOL))
+    _write_erlang_source_cache(stamp_path, checksum.encode('ascii'))
+    return result
+
+
+def _is_erlang_source_cached(path, cachedir):
+    try:
+        stamp_path = _erlang_source_stamp_path(cachedir, path)
+    except OSError:
+        # warned by the directive.
+        return True
+    cache_path = _read_erlang_source_stamp(cachedir, stamp_path)
+    return cache_path is not None and os.path.exists(cache_path)
+
+
+def prune_erlang_source_cache(env):
+    """
+    Remove the files of the erl-autodoc cache which are not of the current
+    content of a source the documents depend on.
+    """
+    cachedir = _erlang_source_cachedir(env)
+    try:
+        names = os.listdir(cachedir)
+    except OSError:
+        return
+    used = set()
+    for paths in env.dependencies.values():
+        for path in paths:
+            if not path.endswith(ERLANG_SOURCE_SUFFIXES):
+                continue
+            try:
+                stamp_path = _erlang_source_stamp_path(cachedir, os.path.join(env.srcdir, path))
+            except OSError:
+                continue
+            cache_path = _read_erlang_source_stamp(cachedir, stamp_path)
+            if cache_path is not None:
+                used.add(os.path.basename(stamp_path))
+                used.add(os.path.basename(cache_path))
+    for name in names:
+        if name not in used:
+            try:
+                os.remove(os.path.join(cachedir, name))
+            except OSError:
+                pass
+
+
+def _erlang_source_cachedir(env):
+    return os.path.join(env.doctreedir, 'erl-autodoc')
+
+# }}} erlang sources.
+
+
+class ErlangAutoModule(Directive):
+    """
+    Directive to describe modules from Erlang sources or documentation chunks.
+    """
+
+    has_content = True
+    required_arguments = 1
+    optional_arguments = 0
+    final_argument_whitespace = False
+    option_spec = {
+        'platform'  : directives.unchanged,
+        'synopsis'  : directives.unchanged,
+        'noindex'   : directives.flag,
+        'deprecated': directives.flag,
+    }
+
+    @staticmethod
+    def find_sources(env, docname, target):
+        # target is a path to a file, or a module name which may contain
+        # wildcards. sources are preferred to documentation chunks, and
+        # chunks to beam files.
+        if target.endswith(ERLANG_SOURCE_SUFFIXES):
+            return [env.relfn2path(target, docname)[1]]
+
+        patterns = [os.path.join(env.app.confdir, dirname, target + '.erl')
+                    for dirname in env.config.erl_source_path]
+        for dirname in env.config.erl_beam_path:
+            for ebin in sorted(glob.glob(os.path.join(env.app.confdir, dirname))):
+                patterns.append(os.path.join(ebin, os.pardir, 'doc', 'chunks', target + '.chunk'))
+                patterns.append(os.path.join(ebin, target + '.beam'))
+
+        found = {}
+        for pattern in patterns:
+            for path in sorted(glob.glob(pattern)):
+                found.setdefault(os.path.splitext(os.path.basename(path))[0], path)
+        return [found[modname] for modname in sorted(found)]
+
+    def run(self):
+        self.env = self.state.document.settings.env
+        target = self.arguments[0].strip()
+
+        paths = self.find_sources(self.env, self.env.docname, target)
+        if not paths:
+            _warn(self.env,
+                'Erlang source of %s is not found in erl_source_path and erl_beam_path.',
+                target,
+                location=(self.env.docname, self.lineno))
+            return []
+
+        content = ViewList()
+        for (i, line) in enumerate(self.content):
+            content.append(line, *self.content.info(i))
+        content.append('', self.state.document.current_source, self.lineno)
+
+        if len(paths) > 1 and multiprocessing.parent_process() is None:
+            # not in a process of parallel reading, which reads documents in
+            # parallel already.
+            _extract_erlang_sources(self.env, paths)
+
+        node = nodes.section()
+        node.document = self.state.document
+        if len(paths) > 1:
+            # the content is for all modules.
+            self.state.nested_parse(content, 0, node)
+            content = None
+
+        # modules are parsed one by one, not to keep all of them in memory.
+        for path in paths:
+            self.env.note_dependency(path)
+            try:
+                result = load_erlang_source(path, _erlang_source_cachedir(self.env))
+            except (OSError, ValueError, zlib.error) as exc:
+                _warn(self.env,
+                    'cannot read Erlang source %s: %s',
+                    path,
+                    exc,
+                    location=(self.env.docname, self.lineno))
+                continue
+            self.state.nested_parse(self._make_lines(path, result, content), 0, node)
+            content = None
+
+        return node.children
+
+    def _make_lines(self, path, result, content):
+        lines = ViewList()
+        if result['module'] is not None:
+            lines.append('.. erl:module:: %s' % (result['module'],), path, 0)
+            for name in ('platform', 'synopsis'):
+                if name in self.options:
+                    lines.append('   :%s: %s' % (name, self.options[name]), path, 0)
+            for name in ('noindex', 'deprecated'):
+                if name in self.options:
+                    lines.append('   :%s:' % (name,), path, 0)
+            lines.append('', path, 0)
+
+        if content is not None:
+            lines.extend(content)
+        for line in result['doc']:
+            lines.append(line, path, 0)
+        lines.append('', path, 0)
+
+        for (objtype, lineno, sig_text, deprecated, source, doc) in result['objects']:
+            offset = max(lineno - 1, 0)
+            lines.append('.. erl:%s:: %s' % (objtype, sig_text), path, offset)
+            if deprecated:
+                lines.append('   :deprecated:', path, offset)
+            if 'noindex' in self.options:
+                lines.append('   :noindex:', path, offset)
+            lines.append('', path, offset)
+            for line in doc:
+                lines.append('   ' + line if line else '', path, offset)
+            lines.append('', path, offset)
+            if source is not None:
+                lines.append('   .. code-block:: erlang', path, offset)
+                lines.append('', path, offset)
+                for (i, line) in enumerate(textwrap.dedent(source).splitlines()):
+                    lines.append('      ' + line if line else '', path, offset + i)
+                lines.append('', path, offset)
+        return lines
+
+
+class ErlangDocgen(Directive):
+    """
+    Directive to describe a module from its erl_docgen XML reference manual.
+    """
+
+    has_content = False
+    required_arguments = 1
+    optional_arguments = 0
+    final_argument_whitespace = False
+    option_spec = {
+        'noindex'   : directives.flag,
+    }
+
+    def run(self):
+        self.env = self.state.document.settings.env
+        path = self.env.relfn2path(self.arguments[0].strip(), self.env.docname)[1]
+        self.env.note_dependency(path)
+
+        options = ['   :noindex:'] if 'noindex' in self.options else []
+        node = nodes.section()
+        node.document = self.state.document
+        try:
+            for lines in iter_docgen_xml(path, options):
+                content = ViewList()
+                for line in lines:
+                    content.append(line, path, 0)
+                self.state.nested_parse(content, 0, node)
+        except (OSError, ElementTree.ParseError) as exc:
+            _warn(self.env,
+                'cannot read erl_docgen XML %s: %s',
+                path,
+                exc,
+                location=(self.env.docname, self.lineno))
+
+        return node.children
+
+
+def _extract_erlang_sources(env, paths):
+    # fills the cache of paths in worker processes, as many as
+    # ``sphinx-build -j N`` allows.
+    if env.app.parallel < 2:
+        return
+    cachedir = _erlang_source_cachedir(env)
+    paths = sorted(path for path in set(paths) if not _is_erlang_source_cached(path, cachedir))
+    max_workers = min(len(paths), env.app.parallel)
+    if max_workers < 2:
+        return
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for _ in executor.map(load_erlang_source, paths, [cachedir] * len(paths)):
+                pass
+    except (OSError, ValueError, zlib.error, RuntimeError, NotImplementedError):
+        # the rest are read by each directive, which warns errors.
+        pass
+
 
 class ErlangXRefRole(XRefRole):
     def process_link(self, env, refnode, has_explicit_title, title, target):
@@ -1166,27 +2672,36 @@ class ErlangModuleIndex(Index):
     shortname = _('modules')
 
     def generate(self, docnames=None):
-        content = {}
         # list of prefixes to ignore
-        ignores = self.domain.env.config['modindex_common_prefix']
-        ignores = sorted(ignores, key=len, reverse=True)
+        ignores = tuple(self.domain.env.config['modindex_common_prefix'])
+        # cached until modules are changed.
+        key = (ignores, frozenset(docnames) if docnames else None)
+        cache = self.domain.module_index_cache
+        if cache is None:
+            cache = self.domain.module_index_cache = {}
+        if key not in cache:
+            cache[key] = self._generate(ignores, docnames)
+            _count('module_index_cache.misses')
+        else:
+            _count('module_index_cache.hits')
+        return cache[key]
+
+    def _generate(self, ignores, docnames):
+        content = {}
+        trie = _prefix_trie(ignores)
+        minv = self.domain.data['modules']
         # list of all modules, sorted by module name
-        modules = sorted(_iteritems(self.domain.data['modules']),
-                         key=lambda x: x[0].lower())
+        modules = self.domain.get_sorted_modules()
         # sort out collapsable modules
         prev_modname = ''
         num_toplevels = 0
-        for modname, (docname, synopsis, platforms, deprecated) in modules:
+        for _key, modname in modules:
+            docname, synopsis, platforms, deprecated = minv[modname]
             if docnames and docname not in docnames:
                 continue
 
-            for ignore in ignores:
-                if modname.startswith(ignore):
-                    modname = modname[len(ignore):]
-                    stripped = ignore
-                    break
-            else:
-                stripped = ''
+            stripped = _longest_prefix(trie, modname)
+            modname = modname[len(stripped):]
 
             # we stripped the whole module name?
             if not modname:
@@ -1224,27 +2739,232 @@ class ErlangModuleIndex(Index):
 
         return content, collapse
 
+def _prefix_trie(prefixes):
+    # -> trie of prefixes, char -> subtrie. key None holds a prefix ending there.
+    trie = {}
+    for prefix in prefixes:
+        node = trie
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[None] = prefix
+    return trie
+
+def _longest_prefix(trie, name):
+    # -> the longest prefix in trie which name starts with, or ''.
+    longest = trie.get(None, '')
+    node = trie
+    for char in name:
+        node = node.get(char)
+        if node is None:
+            break
+        longest = node.get(None, longest)
+    return longest
+
+# letters of buckets of object indices. '_' for names beginning with others.
+INDEX_LETTERS = 'abcdefghijklmnopqrstuvwxyz_'
+
+def _index_letter(name):
+    letter = name.lstrip("'")[:1].lower()
+    if letter and letter in INDEX_LETTERS:
+        return letter
+    return '_'
+
+class ErlangObjectIndex(Index):
+    """
+    Base class of indices of objects of a namespace.
+
+    Entries are bucketed by the first letter of object names, and grouped by
+    module in each bucket. With ``erl_split_index``, the index only links to
+    a page for each letter.
+    """
+
+    nsname = None
+
+    # letter of a page of a split index.
+    letter = None
+
+    @classmethod
+    def letter_index(cls, letter):
+        # -> Index subclass of the page for letter.
+        return type(cls.__name__ + '_' + letter, (cls,), {
+            'name'     : '%s-%s' % (cls.name, letter),
+            'localname': '%s: %s' % (cls.localname, letter.upper()),
+            'shortname': None,
+            'letter'   : letter,
+        })
+
+    def generate(self, docnames=None):
+        buckets = self.domain.get_object_index(self.nsname)
+        if self.letter is not None:
+            letters = [self.letter] if self.letter in buckets else []
+        else:
+            letters = sorted(buckets)
+
+        content = []
+        for letter in letters:
+            entries = buckets[letter]
+            if docnames:
+                entries = self._filter_entries(entries, docnames)
+                if not entries:
+                    continue
+            if self.letter is None and self.domain.env.config['erl_split_index']:
+                num_objects = sum(1 for entry in entries if entry[1] == 2)
+                entries = [[letter.upper(), 0,
+                            '%s-%s-%s' % (self.domain.name, self.name, letter), '',
+                            str(num_objects), '', '']]
+            content.append((letter.upper(), entries))
+
+        # modules are collapsed, there are many objects.
+        return content, True
+
+    @staticmethod
+    def _filter_entries(entries, docnames):
+        # keep objects in docnames, and modules which have them.
+        filtered = []
+        group = None
+        for entry in entries:
+            if entry[1] == 1:
+                group = entry
+            elif entry[2] in docnames:
+                if group is not None:
+                    filtered.append(group)
+                    group = None
+                filtered.append(entry)
+        return filtered
+
+class ErlangFunctionIndex(ErlangObjectIndex):
+    name = 'funcindex'
+    localname = _('Erlang Function Index')
+    shortname = _('functions')
+    nsname = 'fn'
+
+class ErlangTypeIndex(ErlangObjectIndex):
+    name = 'typeindex'
+    localname = _('Erlang Type Index')
+    shortname = _('types')
+    nsname = 'ty'
+
+class ErlangCallbackIndex(ErlangObjectIndex):
+    name = 'callbackindex'
+    localname = _('Erlang Callback Index')
+    shortname = _('callbacks')
+    nsname = 'cb'
+
+class ErlangRecordIndex(ErlangObjectIndex):
+    name = 'recordindex'
+    localname = _('Erlang Record Index')
+    shortname = _('records')
+    nsname = 'rec'
+
+class ErlangMacroIndex(ErlangObjectIndex):
+    name = 'macroindex'
+    localname = _('Erlang Macro Index')
+    shortname = _('macros')
+    nsname = 'macro'
+
+OBJECT_INDICES = [
+    ErlangFunctionIndex,
+    ErlangTypeIndex,
+    ErlangCallbackIndex,
+    ErlangRecordIndex,
+    ErlangMacroIndex,
+]
+
 class ObjectEntry:
-    def __init__(self, docname, deprecated, sigdata, refname, lineno):
-        self.docname    = docname
+    __slots__ = ('docname', 'deprecated', 'sigdata', 'refname', 'lineno', 'alias',
+                 '_dispname', '_title')
+
+    def __init__(self, docname, deprecated, sigdata, refname, lineno, alias=False):
+        self.docname    = sys.intern(docname)
         self.deprecated = deprecated
         self.sigdata    = sigdata
         self.refname    = refname
         self.lineno     = lineno
+        # True if this is a flavorless alias of a flavored description.
+        # an alias shares sigdata with the flavored entry.
+        self.alias      = alias
+
+        # computed on first use, most of them are never rendered.
+        self._dispname  = None
+        self._title     = None
+
+    # pickled as a tuple, same as ErlangSignature.
+    # dispname and title are not pickled.
+    def __getstate__(self):
+        return (self.docname, self.deprecated, self.sigdata, self.refname, self.lineno,
+                self.alias)
+
+    def __setstate__(self, state):
+        (self.docname, self.deprecated, self.sigdata, self.refname, self.lineno,
+         self.alias) = state
+        self._dispname  = None
+        self._title     = None
+
+    @property
+    def objtype(self):
+        return self.sigdata.decltype
+
+    @property
+    def dispname(self):
+        if self._dispname is None:
+            dispname = self.sigdata.to_disp_name(with_flavor=not self.alias)
+            if self.deprecated:
+                dispname += ' (deprecated)'
+            self._dispname = dispname
+        return self._dispname
+
+    @property
+    def title(self):
+        # title of references to this entry.
+        if self._title is None:
+            objtype = self.objtype
+            if objtype == 'callback':
+                title = '%s (%s)' % (self.dispname, _('callback function'))
+            elif objtype == 'function':
+                title = self.dispname
+            elif objtype == 'macro':
+                title = self.dispname
+            elif objtype == 'record':
+                title = self.dispname
+            elif objtype == 'opaque':
+                title = '%s %s' % (self.dispname, _('opaque type'))
+            elif objtype == 'type':
+                title = '%s %s' % (self.dispname, _('type'))
+            else:
+                raise ValueError
+            self._title = title
+        return self._title
+
+    def to_xref_target(self):
+        # -> (title, docname, refname) of resolve_xref.
+        return (self.title, self.docname, self.refname)
+
+    def index_name(self, arity_lo, arity_hi, flavor):
+        # name in object indices, without module.
+        sigdata = self.sigdata
+        if sigdata.nsname == 'macro':
+            name = '?' + sigdata.name
+        elif sigdata.nsname == 'rec':
+            name = '#' + sigdata.name
+        else:
+            name = sigdata.name
+        if arity_lo is not None:
+            if arity_lo == arity_hi:
+                name += '/%d' % (arity_lo,)
+            else:
+                name += '/%d..%d' % (arity_lo, arity_hi)
+        if flavor is not None:
+            name += '@%s' % (flavor,)
+        return name
 
-        self.dispname = sigdata.to_disp_name()
-        if deprecated:
-            self.dispname += ' (deprecated)'
-
-        self.objtype  = sigdata.decltype
-
-    def copy(self, sigdata):
+    def make_alias(self):
         return ObjectEntry(
                 self.docname,
                 self.deprecated,
-                sigdata,
-                self.refname,
+                self.sigdata,
+                ErlangSignature.drop_flavor_from_full_name(self.refname),
                 self.lineno,
+                alias=True,
             )
 
     def intersphinx_names(self, arity, flavor):
@@ -1275,7 +2995,7 @@ class ObjectEntry:
                 '(%s)' % (', '.join(arg_names), ),
             ]
 
-        if self.sigdata.flavor is None:
+        if self.sigdata.flavor is None or self.alias:
             flavor_variants = ['']
         else:
             flavor_variants = ['', '@%s' % (flavor, )]
@@ -1293,12 +3013,434 @@ class ObjectEntry:
                     ])
                     yield invname
 
+    def canonical_name(self, arity, flavor, arity_hi=None):
+        # The only name in the compact inventory. Other spellings are
+        # canonicalized by ErlangDomain.get_full_qualified_name.
+        # an interval of arities is written once as 'name/lo..hi'.
+        if arity is None:
+            name = '%s:%s'    % (self.sigdata.modname, self.sigdata.name)
+        else:
+            name = '%s:%s/%d' % (self.sigdata.modname, self.sigdata.name, arity)
+            if arity_hi is not None and arity_hi != arity:
+                name += '..%d' % (arity_hi,)
+        if flavor is not None:
+            name += '@%s' % (flavor, )
+        return name
+
+    def lookup_arities(self, arity_lo, arity_hi):
+        # arities in an interval which have names of lookup_names, i.e.
+        # 'name()' and 'name(Arg1, ...)' of the arguments in the signature.
+        if arity_lo is None:
+            return [None]
+        if self.sigdata.arg_list is None:
+            arity_max = 0
+        else:
+            arity_max = len(self.sigdata.arg_list)
+        return range(arity_lo, min(arity_hi, arity_max) + 1)
+
+    def lookup_names(self, arity, flavor):
+        # Create names which are resolved to this entry by
+        # ErlangDomain._find_obj. unlike intersphinx_names, a flavored entry
+        # does not have flavorless names, they belong to its alias.
+        # 'name/arity' is not created, it is looked up in the arity
+        # intervals by ErlangDomain._lookup_xref_index.
+
+        if self.objtype == 'macro':
+            sigil_variants = ['', '?']
+        elif self.objtype == 'record':
+            sigil_variants = ['', '#']
+        else:
+            sigil_variants = ['']
+
+        if self.objtype == 'record':
+            arg_variants = ['', '{}']
+        elif arity is None:
+            arg_variants = ['']
+        elif arity == 0:
+            arg_variants = ['()']
+        else:
+            arg_variants = []
+            if self.sigdata.arg_list is not None:
+                arg_names = [pair[1] for pair in self.sigdata.arg_list[0:arity]]
+                # other texts, e.g. 'Opt = []', may be parsed as another arity.
+                if len(arg_names) == arity and \
+                        all(RE_VARIABLE.match(arg_name) for arg_name in arg_names):
+                    arg_variants.append('(%s)' % (', '.join(arg_names), ))
+
+        if flavor is None:
+            flavor_part = ''
+        else:
+            flavor_part = '@%s' % (flavor, )
+
+        for sigil in sigil_variants:
+            for arg in arg_variants:
+                yield ''.join([
+                    self.sigdata.modname,
+                    ':',
+                    sigil,
+                    self.sigdata.name,
+                    arg,
+                    flavor_part,
+                ])
+
     def to_intersphinx_target(self, fullname):
         # '1' means default search priority.
         # See sphinx.domains.Domain#get_objects.
         return (fullname, fullname, self.objtype, self.docname, self.refname, 1)
 
 
+# lines of the erl: section of objects.inv, see sphinx.util.inventory.
+RE_ERL_INVENTORY_LINE = re.compile(br'''
+    ^(?P<name>.+?)\s+erl:(?P<objtype>\w+)\s+-?\d+\s+?(?P<location>\S*)\s+(?P<dispname>[^\r\n]*)
+    ''', re.VERBOSE | re.MULTILINE)
+
+def _external_inventory_entries(data):
+    # yields (nsname, modname, name, flavor, arity_lo, arity_hi, item) of erl
+    # objects in the bytes of an objects.inv. item is (project, version,
+    # location, dispname), where location is not joined with the base uri.
+    # other domains are not parsed.
+    lines = data.split(b'\n', 4)
+    if len(lines) < 5 or not lines[0].startswith(b'# Sphinx inventory version 2') \
+            or b'zlib' not in lines[3]:
+        raise ValueError('unsupported inventory')
+    project = lines[1].decode('utf-8').rstrip()[11:]
+    version = lines[2].decode('utf-8').rstrip()[11:]
+    for m in RE_ERL_INVENTORY_LINE.finditer(zlib.decompress(lines[4])):
+        nsname = ErlangObject.NAMESPACE_FROM_OBJTYPE.get(m.group('objtype').decode('utf-8'))
+        if nsname is None:
+            continue
+        invname = m.group('name').decode('utf-8')
+        n = RE_INVENTORY_NAME.match(invname)
+        if n is None:
+            # variants with sigils or argument lists.
+            continue
+        arity_lo = arity_hi = n.group('arity')
+        if arity_lo is not None:
+            arity_lo = int(arity_lo)
+            arity_hi = int(n.group('arity_max') or arity_lo)
+        location = m.group('location').decode('utf-8')
+        if location.endswith('$'):
+            location = location[:-1] + invname
+        dispname = m.group('dispname').decode('utf-8').rstrip()
+        yield (nsname, n.group('modname'), n.group('name'), n.group('flavor'),
+               arity_lo, arity_hi, (project, version, location, dispname))
+
+def _intersphinx_sources(config):
+    """
+    Yield (base uri, [locations of objects.inv]) of ``intersphinx_mapping``,
+    from the one taking precedence.
+
+    sphinx.ext.intersphinx merges sorted named inventories, then unnamed
+    ones, and a later one overrides an earlier one.
+    """
+    named   = []
+    unnamed = []
+    for name, (uri, invs) in config.intersphinx_mapping.values():
+        if not isinstance(invs, (list, tuple)):
+            invs = (invs,)
+        if name:
+            named.append((name, uri, invs))
+        else:
+            unnamed.append((name, uri, invs))
+    named.sort(key=lambda source: source[0])
+    for _name, uri, invs in reversed(named + unnamed):
+        if '://' in uri:
+            # same as sphinx.ext.intersphinx, without basic auth.
+            uri = re.sub(r'(://)[^/@]*@', r'\1', uri, count=1)
+        yield uri, [inv or posixpath.join(uri, 'objects.inv') for inv in invs]
+
+def _read_inventory(env, inv):
+    # -> bytes of objects.inv at inv, a URL or a path relative to srcdir.
+    if '://' in inv:
+        try:
+            from sphinx.ext.intersphinx._load import _read_from_url
+        except ImportError:
+            # sphinx 7.3 and prior.
+            from sphinx.ext.intersphinx import _read_from_url
+        f = _read_from_url(inv, config=env.config)
+    else:
+        f = open(os.path.join(env.srcdir, inv), 'rb')
+    with f:
+        return f.read()
+
+
+class ExternalInventoryCache:
+    """
+    Erlang objects of intersphinx inventories, indexed in a SQLite database.
+
+    The ``erl:`` section of an ``objects.inv`` is indexed once per checksum
+    of its content. Local inventories are read on every build, remote ones
+    as often as ``intersphinx_cache_limit`` allows. Lookups query the
+    database, so the entries are not loaded into memory.
+    """
+
+    FILENAME = 'erl-intersphinx.db'
+    SCHEMA_VERSION = 3
+
+    def __init__(self, path, env):
+        self.conn = sqlite3.connect(path)
+        self._setup_schema()
+
+        cache_limit = getattr(env.config, 'intersphinx_cache_limit', 5)
+        now = int(time.time())
+        expires = None if cache_limit < 0 else now - cache_limit * 86400
+
+        # checksum -> (rank, base uri) of inventories in use.
+        # lower ranks take precedence.
+        self.inventories = {}
+        for rank, (uri, invs) in enumerate(_intersphinx_sources(env.config)):
+            for inv in invs:
+                checksum = self._add_inventory(env, inv, now, expires)
+                if checksum is not None:
+                    self.inventories.setdefault(checksum, (rank, uri))
+                    break
+        self._drop_unused()
+        self.conn.commit()
+
+    def _setup_schema(self):
+        cur = self.conn.cursor()
+        (version,) = cur.execute('PRAGMA user_version').fetchone()
+        if version != self.SCHEMA_VERSION:
+            cur.execute('DROP TABLE IF EXISTS inventories')
+            cur.execute('DROP TABLE IF EXISTS sources')
+            cur.execute('DROP TABLE IF EXISTS entries')
+        cur.execute('CREATE TABLE IF NOT EXISTS inventories (checksum TEXT PRIMARY KEY)')
+        cur.execute('CREATE TABLE IF NOT EXISTS sources'
+                    ' (location TEXT PRIMARY KEY, checksum TEXT, fetched INTEGER)')
+        cur.execute('CREATE TABLE IF NOT EXISTS entries'
+                    ' (checksum TEXT, nsname TEXT, modname TEXT, name TEXT,'
+                    '  flavor TEXT, arity_lo INTEGER, arity_hi INTEGER,'
+                    '  project TEXT, version TEXT, location TEXT, dispname TEXT)')
+        cur.execute('CREATE INDEX IF NOT EXISTS entries_by_name'
+                    ' ON entries (nsname, modname, name)')
+        cur.execute('PRAGMA user_version = %d' % (self.SCHEMA_VERSION,))
+
+    def _add_inventory(self, env, inv, now, expires):
+        # -> checksum of the inventory at inv, or None if it is not readable.
+        cur = self.conn.cursor()
+        remote = '://' in inv
+        if remote:
+            row = cur.execute('SELECT checksum, fetched FROM sources WHERE location = ?',
+                              (inv,)).fetchone()
+            if row is not None and (expires is None or row[1] >= expires):
+                return row[0]
+        try:
+            data = _read_inventory(env, inv)
+        except Exception:
+            # warned by sphinx.ext.intersphinx.
+            return None
+        checksum = hashlib.sha1(data).hexdigest()
+        if not cur.execute('SELECT 1 FROM inventories WHERE checksum = ?',
+                           (checksum,)).fetchone():
+            try:
+                entries = list(_external_inventory_entries(data))
+            except (ValueError, zlib.error):
+                return None
+            cur.executemany('INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                            ((checksum,) + entry[:6] + entry[6] for entry in entries))
+            cur.execute('INSERT INTO inventories VALUES (?)', (checksum,))
+        if remote:
+            cur.execute('INSERT OR REPLACE INTO sources VALUES (?, ?, ?)', (inv, checksum, now))
+        return checksum
+
+    def _drop_unused(self):
+        # drop inventories which are not used any more, e.g. older versions.
+        cur = self.conn.cursor()
+        for (checksum,) in cur.execute('SELECT checksum FROM inventories').fetchall():
+            if checksum not in self.inventories:
+                cur.execute('DELETE FROM entries WHERE checksum = ?', (checksum,))
+                cur.execute('DELETE FROM sources WHERE checksum = ?', (checksum,))
+                cur.execute('DELETE FROM inventories WHERE checksum = ?', (checksum,))
+
+    def get(self, key):
+        # (nsname, modname, name) -> Optional[flavor -> [(arity_lo, arity_hi, item)]]
+        # from the inventory taking precedence.
+        rows = self.conn.execute(
+            'SELECT checksum, flavor, arity_lo, arity_hi, project, version, location, dispname'
+            ' FROM entries WHERE nsname = ? AND modname = ? AND name = ?',
+            key).fetchall()
+        rows = sorted((row for row in rows if row[0] in self.inventories),
+                      key=lambda row: self.inventories[row[0]][0])
+        if not rows:
+            return None
+        flavors = {}
+        for checksum, flavor, arity_lo, arity_hi, project, version, location, dispname in rows:
+            uri = posixpath.join(self.inventories[checksum][1], location)
+            flavors.setdefault(flavor, []).append(
+                (arity_lo, arity_hi, (project, version, uri, dispname)))
+        return flavors
+
+    def close(self):
+        self.conn.close()
+
+
+def _arities(arity_lo, arity_hi):
+    # arities in an interval. (None, None) is the interval of no arity.
+    if arity_lo is None:
+        return [None]
+    return range(arity_lo, arity_hi + 1)
+
+def _find_interval(pieces, arity):
+    # [(arity_lo, arity_hi, entry)] -> Optional[entry]
+    for arity_lo, arity_hi, entry in pieces:
+        if arity_lo is None:
+            if arity is None:
+                return entry
+        elif arity is not None and arity_lo <= arity <= arity_hi:
+            return entry
+    return None
+
+def _split_interval(arity_lo, arity_hi, pieces):
+    # split an interval by non-overlapping pieces [(arity_lo, arity_hi, entry)].
+    # returns ([(lo, hi)] not in pieces, [(lo, hi, entry)] in pieces).
+    if arity_lo is None:
+        for piece in pieces:
+            if piece[0] is None:
+                return [], [piece]
+        return [(None, None)], []
+
+    free     = []
+    overlaps = []
+    cur = arity_lo
+    for lo, hi, entry in sorted((p for p in pieces if p[0] is not None), key=lambda p: p[0]):
+        if hi < cur:
+            continue
+        if lo > arity_hi:
+            break
+        if lo > cur:
+            free.append((cur, lo - 1))
+        overlaps.append((max(lo, cur), min(hi, arity_hi), entry))
+        cur = hi + 1
+        if cur > arity_hi:
+            break
+    if cur <= arity_hi:
+        free.append((cur, arity_hi))
+    return free, overlaps
+
+
+# {{{ type index.
+
+RE_TYPE_TOKEN = re.compile(r"""
+      "(?:[^"\\]|\\.)*"
+    | (?<![\w@]) \#\s*(?P<record> [a-z][\w@]*|'[^']*' )\s*\{
+    | (?<![\w@]) (?:(?P<module> [a-z][\w@]*|'[^']*' )\s*:\s*)?
+                  (?P<type> [a-z][\w@]*|'[^']*' )\s*\(
+    | (?<![\w@]) (?P<var> [A-Z_][\w@]* )
+    | '(?:[^'\\]|\\.)*'
+    """, re.VERBOSE)
+
+RE_WHEN_KEYWORD = re.compile(r'\bwhen\b')
+
+# types which are not qualified by the module of a spec.
+BUILTIN_TYPES = frozenset([
+    'any', 'arity', 'atom', 'binary', 'bitstring', 'boolean', 'byte', 'char',
+    'dynamic', 'float', 'fun', 'function', 'identifier', 'integer', 'iodata',
+    'iolist', 'list', 'map', 'maybe_improper_list', 'mfa', 'module', 'neg_integer',
+    'nil', 'no_return', 'node', 'non_neg_integer', 'none', 'nonempty_binary',
+    'nonempty_bitstring', 'nonempty_improper_list', 'nonempty_list',
+    'nonempty_maybe_improper_list', 'nonempty_string', 'number', 'pid', 'port',
+    'pos_integer', 'reference', 'string', 'term', 'timeout', 'tuple',
+])
+
+def _type_key(modname, module, name):
+    # -> key of a type in the type index, 'name' of builtin types or
+    # 'module:name'. local types belong to modname.
+    name = ErlangSignature.canon_atom(name)
+    if module is not None:
+        return '%s:%s' % (ErlangSignature.canon_atom(module), name)
+    if name in BUILTIN_TYPES:
+        return name
+    return '%s:%s' % (modname, name)
+
+def _spec_types(modname, text, constraints, seen):
+    # yields keys of types in text. variables are replaced with their types
+    # in constraints, var -> [text].
+    for m in RE_TYPE_TOKEN.finditer(text):
+        if m.group('record') is not None:
+            try:
+                yield '#' + ErlangSignature.canon_atom(m.group('record'))
+            except ValueError:
+                pass
+        elif m.group('type') is not None:
+            try:
+                yield _type_key(modname, m.group('module'), m.group('type'))
+            except ValueError:
+                pass
+        elif m.group('var') is not None:
+            var = m.group('var')
+            if var in seen or var not in constraints:
+                continue
+            seen.add(var)
+            for constraint in constraints[var]:
+                for key in _spec_types(modname, constraint, constraints, seen):
+                    yield key
+
+def spec_types(sigdata):
+    """
+    Return a set of (position, type key) of the types in the signature of a
+    function or callback. position is 'arg' or 'ret'. type key is 'name'
+    of builtin types, 'module:name' of other types or '#name' of records.
+    Variables bound by ``when`` are replaced with their types.
+    """
+    if sigdata.arg_list is None and sigdata.ret_ann is None:
+        return set()
+
+    ret_text = sigdata.ret_ann or ''
+    when_texts = [sigdata.when_text or '']
+    parts = RE_WHEN_KEYWORD.split(ret_text, 1)
+    if len(parts) == 2:
+        ret_text = parts[0]
+        when_texts.append(parts[1])
+    constraints = {}
+    for when_text in when_texts:
+        for constraint in _split_erlang(when_text, ','):
+            var, sep, type_text = constraint.partition('::')
+            if sep and RE_VARIABLE.match(var.strip()):
+                constraints.setdefault(var.strip(), []).append(type_text)
+
+    modname = sigdata.modname
+    result = set()
+    for _kind, arg_text in sigdata.arg_list or ():
+        result.update(('arg', key) for key in _spec_types(modname, arg_text, constraints, set()))
+    result.update(('ret', key) for key in _spec_types(modname, ret_text, constraints, set()))
+    return result
+
+RE_XREF_NAME_END = re.compile(r'[(/{@\s]')
+
+def _xref_key_name(target):
+    # name of a target without module, arity, arguments and flavor, e.g.
+    # 'mod:name/1', '~name(A)', '#rec' or '?MACRO' -> 'name', 'rec', 'MACRO'.
+    # also used for object names of 'docs', 'mod:name' -> 'name'.
+    head = RE_XREF_NAME_END.split(target.lstrip('~:'), 1)[0]
+    return head.rsplit(':', 1)[-1].lstrip('#?')
+
+def _resolved_docnames(role, found):
+    # -> docnames of a value of 'resolved'.
+    if not found:
+        return ()
+    if role == 'any':
+        return [docname for (_role, (_title, docname, _refname)) in found]
+    return (found[1],)
+
+def _type_name(type_key):
+    # -> name of a type key without module, None for records.
+    if type_key.startswith('#'):
+        return None
+    return type_key.partition(':')[2] or type_key
+
+def _type_query_keys(keys, type_names, type_name):
+    # keys of the type index matching a query, see ErlangDomain.find_by_type.
+    type_name = type_name.strip()
+    for suffix in ('()', '{}'):
+        if type_name.endswith(suffix):
+            type_name = type_name[:-len(suffix)].rstrip()
+    if ':' in type_name or type_name.startswith('#'):
+        return [type_name] if type_name in keys else []
+    return type_names.get(type_name, ())
+
+# }}} type index.
+
+
 class ErlangDomain(Domain):
     """Erlang language domain."""
     name = 'erl'
@@ -1327,6 +3469,8 @@ class ErlangDomain(Domain):
         'type'         : ErlangObject,
         'module'       : ErlangModule,
         'currentmodule': ErlangCurrentModule,
+        'automodule'   : ErlangAutoModule,
+        'docgen'       : ErlangDocgen,
         'marker'       : ErlangMarker,
     }
 
@@ -1343,8 +3487,9 @@ class ErlangDomain(Domain):
 
     initial_data = {
         'objects'   : {
-            # :: namespace -> modfuncname -> arity -> flavor -> ObjectEntry
-            # arity maybe None for receords and macros.
+            # :: namespace -> modfuncname -> flavor -> [(arity_lo, arity_hi, ObjectEntry)]
+            # arity intervals of a flavor do not overlap each other.
+            # (None, None) for receords and macros without arity.
             'cb'    : {},
             'fn'    : {},
             'macro' : {},
@@ -1352,42 +3497,458 @@ class ErlangDomain(Domain):
             'ty'    : {},
         },
         'modules'   : {}, # modname -> docname, synopsis, platform, deprecated
-        'markers'   : {}, # marker_name  -> Marker
+        'markers'   : {}, # (modname, marker_name) -> MarkerEntry
+        'docs'      : {}, # docname -> set of (nsname, name, flavor)
+                          # nsname is 'mod' for modules and 'mk' for markers,
+                          # whose name is (modname, marker_name).
+        'cited'     : {}, # docname -> set of xref keys of its references
+        'citers'    : {}, # xref key -> set of docnames referring to it
+        'resolved'  : {}, # xref key -> (title, docname, refname) or None
+                          # when the docs referring to it were last written.
+                          # xref key is (role, modname, target), see _xref_key.
+        'types'     : {}, # type key -> set of (position, fullname, objtype,
+                          #                     docname, refname)
+                          # of functions and callbacks, see spec_types.
+        'doc_types' : {}, # docname -> set of (type key, item of 'types')
+        'type_names': {}, # type name without module -> set of type keys
+                          # in 'types', see _type_name.
+        'reads'     : [], # ('obj', objname, arity_lo, arity_hi, ObjectEntry),
+                          # ('mod', modname, info, lineno) or
+                          # ('mk', (modname, marker_name), MarkerEntry)
+                          # in the order of registration. only kept by a
+                          # process of parallel reading, see _log_read.
     }
 
-    data_version = 3
+    data_version = 14
 
     indices = [
         ErlangModuleIndex,
-    ]
+    ] + OBJECT_INDICES
+
+    # (nsname, lookup name) -> ObjectEntry.
+    # built by build_xref_index when reading is finished. not pickled.
+    xref_index = None
+
+    # lookup name -> list of (role, (title, docname, refname) or ObjectEntry).
+    # built from xref_index on the first resolve_any_xref. not pickled.
+    any_index = None
+
+    # docname -> list of object tuples of get_objects. not pickled.
+    objects_cache = None
+
+    # (nsname, modname, name) -> flavor -> [(arity_lo, arity_hi, intersphinx inventory item)].
+    # an ExternalInventoryCache, or a dict if sqlite is not available.
+    # opened on the first missing reference, closed when the build is
+    # finished. not pickled.
+    external_index = None
+
+    # docnames cleared since the last get_updated_docs. not pickled.
+    cleared_docs = None
+
+    # list of docnames to read, and the pid of the process reading them,
+    # set by env-before-read-docs. not pickled.
+    read_order = None
+    read_pid   = None
+
+    # list of (docnames, 'reads' of the process which read them), merged
+    # by merge_domaindata and replayed by replay_reads. not pickled.
+    merged_reads = None
+
+    # sorted list of (lowercased modname, modname).
+    # built by the first get_sorted_modules, then kept sorted by note_module
+    # and clear_doc. not pickled.
+    sorted_modules = None
+
+    # (modindex_common_prefix, docnames) -> result of ErlangModuleIndex.generate.
+    # cleared when modules are changed. not pickled.
+    module_index_cache = None
+
+    # marker_name -> sorted list of modnames which have the marker.
+    # built by the first reference to a marker out of its module. not pickled.
+    marker_index = None
+
+    # nsname -> letter -> entries of ErlangObjectIndex.
+    # built by the first ErlangObjectIndex.generate. not pickled.
+    object_index = None
 
     def clear_doc(self, docname):
-        rmmods = []
-        for modname in self.data['modules']:
-            if self.data['modules'][modname][0] == docname:
-                rmmods.append(modname)
-        for modname in rmmods:
-            del self.data['modules'][modname]
+        self.xref_index   = None
+        self.any_index    = None
+        self.object_index = None
+        if self.objects_cache:
+            self.objects_cache.pop(docname, None)
+        if self.cleared_docs is None:
+            self.cleared_docs = set()
+        self.cleared_docs.add(docname)
+        types = self.data['types']
+        type_names = self.data['type_names']
+        for type_key, item in self.data['doc_types'].pop(docname, ()):
+            items = types.get(type_key)
+            if items is None:
+                continue
+            items.discard(item)
+            if not items:
+                del types[type_key]
+                name = _type_name(type_key)
+                if name is not None:
+                    type_names[name].discard(type_key)
+                    if not type_names[name]:
+                        del type_names[name]
+        citers = self.data['citers']
+        for xref_key in self.data['cited'].pop(docname, ()):
+            docnames = citers.get(xref_key)
+            if docnames is None:
+                continue
+            docnames.discard(docname)
+            if not docnames:
+                del citers[xref_key]
+                self.data['resolved'].pop(xref_key, None)
+        for key in self.data['docs'].pop(docname, ()):
+            nsname, name, flavor = key
+            if nsname == 'mod':
+                minv = self.data['modules']
+                if name in minv and minv[name][0] == docname:
+                    self._remove_module(name)
+                continue
+            if nsname == 'mk':
+                k_inv = self.data['markers']
+                if name in k_inv and k_inv[name].docname == docname:
+                    del k_inv[name]
+                    self.marker_index = None
+                continue
 
-        for nsname, oinv in _iteritems(self.data['objects']):
-            rmfuncs = []
-            for objname, arities in _iteritems(oinv):
-                rmarities = []
-                for arity, flavors in _iteritems(arities):
-                    rmflavors = []
-                    for flavor, entry in _iteritems(flavors):
-                        if entry.docname == docname:
-                            rmflavors.append(flavor)
-                    for flavor in rmflavors:
-                        del oinv[objname][arity][flavor]
-                    if not oinv[objname][arity]:
-                        rmarities.append(arity)
-                for arity in rmarities:
-                    del oinv[objname][arity]
-                if not oinv[objname]:
-                    rmarities.append(objname)
-            for objname in rmfuncs:
-                del oinv[objname]
+            oinv = self.data['objects'][nsname]
+            flavors = oinv.get(name)
+            if flavors is None or flavor not in flavors:
+                continue
+            pieces = [piece for piece in flavors[flavor] if piece[2].docname != docname]
+            if pieces:
+                flavors[flavor] = pieces
+            else:
+                del flavors[flavor]
+            if not flavors:
+                del oinv[name]
+
+    def _log_read(self, read):
+        # -> True in a process of parallel reading, where `read` is logged
+        # to be replayed by the main process and duplicates are not warned.
+        # see replay_reads.
+        if self.read_pid is None or self.read_pid == os.getpid():
+            return False
+        self.data['reads'].append(read)
+        return True
+
+    def add_module(self, modname, info, lineno):
+        """
+        Register a module described at `lineno` of ``info[0]``, see
+        note_module.
+
+        Warns if another document already describes the module.
+        """
+        warn = not self._log_read(('mod', modname, info, lineno))
+        self._add_module(modname, info, lineno, warn)
+
+    def _add_module(self, modname, info, lineno, warn):
+        minv = self.data['modules']
+        if modname not in minv:
+            self.note_module(modname, info)
+            self.note_docobj(info[0], ('mod', modname, None))
+        elif warn:
+            _warn(self.env,
+                'duplicate Erlang module name of %s, other instance in %s.',
+                modname,
+                self.env.doc2path(minv[modname][0]),
+                location=(info[0], lineno))
+
+    def note_marker(self, key, k_entry):
+        """
+        Register a marker `key` (modname, marker_name) unless it is
+        registered already.
+        """
+        self._log_read(('mk', key, k_entry))
+        k_inv = self.data['markers']
+        if key not in k_inv:
+            # seealso: ErlangDomain.get_objects
+            k_inv[key] = k_entry
+            self.marker_index = None
+            self.note_docobj(k_entry.docname, ('mk', key, None))
+
+    def note_module(self, modname, info):
+        """
+        Register a module, `info` is (docname, synopsis, platform, deprecated).
+        """
+        self.data['modules'][modname] = info
+        self.module_index_cache = None
+        if self.sorted_modules is not None:
+            bisect.insort(self.sorted_modules, (modname.lower(), modname))
+
+    def _remove_module(self, modname):
+        del self.data['modules'][modname]
+        self.module_index_cache = None
+        if self.sorted_modules is not None:
+            item = (modname.lower(), modname)
+            i = bisect.bisect_left(self.sorted_modules, item)
+            if i < len(self.sorted_modules) and self.sorted_modules[i] == item:
+                del self.sorted_modules[i]
+
+    def get_sorted_modules(self):
+        """
+        Return a list of (lowercased modname, modname) sorted by them.
+        """
+        if self.sorted_modules is None:
+            self.sorted_modules = sorted(
+                (modname.lower(), modname) for modname in self.data['modules'])
+        return self.sorted_modules
+
+    def note_docobj(self, docname, key):
+        """
+        Record that `key` (nsname, name, flavor) is owned by `docname`.
+        """
+        self.data['docs'].setdefault(docname, set()).add(key)
+
+    def note_object(self, objname, arity_lo, arity_hi, entry):
+        """
+        Register `entry` as `objname` of arities from `arity_lo` to
+        `arity_hi`, with a flavorless alias.
+
+        Warns for each arity which another description of the same flavor
+        already has.
+        """
+        warn = not self._log_read(('obj', objname, arity_lo, arity_hi, entry))
+        self._note_object(objname, arity_lo, arity_hi, entry, warn)
+
+    def _note_object(self, objname, arity_lo, arity_hi, entry, warn):
+        sigdata = entry.sigdata
+        nsname  = sigdata.nsname
+        flavors = self.data['objects'][nsname].setdefault(objname, {})
+        pieces  = flavors.setdefault(sigdata.flavor, [])
+        free, overlaps = _split_interval(arity_lo, arity_hi, pieces)
+
+        # ng. warn duplicate.
+        for lo, hi, prev_entry in overlaps:
+            if not warn:
+                break
+            for arity in _arities(lo, hi):
+                self._warn_duplicate_object(prev_entry, entry, arity)
+        if not free:
+            return
+
+        # ok. register entry.
+        pieces.extend((lo, hi, entry) for (lo, hi) in free)
+        self.note_docobj(entry.docname, (nsname, objname, sigdata.flavor))
+
+        if sigdata.flavor is not None:
+            alias = None
+            for lo, hi in free:
+                alias_free, _overlaps = _split_interval(lo, hi, flavors.get(None, ()))
+                if alias_free:
+                    if alias is None:
+                        alias = entry.make_alias()
+                    flavors.setdefault(None, []).extend(
+                        (alias_lo, alias_hi, alias) for (alias_lo, alias_hi) in alias_free)
+            if alias is not None:
+                self.note_docobj(entry.docname, (nsname, objname, None))
+
+    def _warn_duplicate_object(self, prev_entry, entry, arity):
+        sigdata = entry.sigdata
+        if arity is None:
+            name_tmp = '%s:%s'    % (sigdata.modname, sigdata.name)
+        else:
+            name_tmp = '%s:%s/%d' % (sigdata.modname, sigdata.name, arity)
+        if sigdata.flavor:
+            name_tmp += ' {flavor=%s}' % (sigdata.flavor,)
+        _warn(self.env,
+            'duplicate Erlang %s description of %s, '
+            'other instance in %s line %d.',
+            sigdata.decltype,
+            name_tmp,
+            self.env.doc2path(prev_entry.docname),
+            prev_entry.lineno,
+            location=(entry.docname, entry.lineno))
+
+    def process_doc(self, env, docname, document):
+        xref_keys = set()
+        for node in _findall(document, addnodes.pending_xref):
+            xref_key = self._xref_key(node)
+            if xref_key is not None:
+                xref_keys.add(xref_key)
+        if xref_keys:
+            self.data['cited'][docname] = xref_keys
+            citers = self.data['citers']
+            for xref_key in xref_keys:
+                citers.setdefault(xref_key, set()).add(docname)
+
+        doc_types = self._doc_spec_types(docname)
+        if doc_types:
+            self._note_doc_types(docname, doc_types)
+
+    def _note_doc_types(self, docname, doc_types):
+        self.data['doc_types'][docname] = doc_types
+        types = self.data['types']
+        type_names = self.data['type_names']
+        for type_key, item in doc_types:
+            items = types.get(type_key)
+            if items is None:
+                items = types[type_key] = set()
+                name = _type_name(type_key)
+                if name is not None:
+                    type_names.setdefault(name, set()).add(type_key)
+            items.add(item)
+
+    def _doc_spec_types(self, docname):
+        # -> set of (type key, item of 'types') of functions and callbacks
+        # described in docname.
+        doc_types = set()
+        for nsname, objname, flavor in self.data['docs'].get(docname, ()):
+            if nsname not in ('fn', 'cb'):
+                continue
+            pieces = self.data['objects'][nsname].get(objname, {}).get(flavor, ())
+            entries = set(piece[2] for piece in pieces
+                          if piece[2].docname == docname and not piece[2].alias)
+            for entry in entries:
+                sigdata = entry.sigdata
+                fullname = sigdata.to_full_name()
+                for position, type_key in spec_types(sigdata):
+                    doc_types.add((type_key, (position, fullname, entry.objtype,
+                                              docname, entry.refname)))
+        return doc_types
+
+    def find_by_type(self, type_name, position=None):
+        """
+        Return a sorted list of (position, fullname, objtype, docname,
+        refname) of functions and callbacks whose specs refer to `type_name`.
+
+        `type_name` is e.g. ``'socket()'``, ``'inet:socket()'`` or
+        ``'#record{}'``. A name without module matches the builtin type and
+        the types of that name in any module. `position` is ``'arg'``,
+        ``'ret'`` or None for both.
+        """
+        types = self.data['types']
+        result = set()
+        for type_key in _type_query_keys(types, self.data['type_names'], type_name):
+            result.update(item for item in types[type_key]
+                          if position is None or item[0] == position)
+        return sorted(result)
+
+    @staticmethod
+    def _xref_key(node):
+        # pending_xref -> (role, modname, target) of references which may be
+        # resolved by this domain. modname is the current module unless
+        # target is a module.
+        if node.get('refdomain') == 'erl':
+            role = node['reftype']
+            if role == 'marker':
+                return None
+        elif node.get('reftype') == 'any':
+            role = 'any'
+        else:
+            return None
+        if role == 'mod':
+            modname = None
+        else:
+            modname = node.get('erl:module')
+        return (role, modname, node['reftarget'])
+
+    def get_updated_docs(self):
+        """
+        Return docnames whose references to objects of this domain are
+        resolved to other titles or targets than when they were written.
+
+        Only the references which may be affected by the documents cleared
+        since the last call are resolved again: new ones, those resolved
+        to the cleared documents, and those whose names are of objects,
+        modules or markers described in the cleared documents now.
+        """
+        cleared_docs = self.cleared_docs or set()
+        self.cleared_docs = None
+        if self.xref_index is None:
+            self.build_xref_index()
+
+        names = set()
+        for docname in cleared_docs:
+            for nsname, name, _flavor in self.data['docs'].get(docname, ()):
+                if nsname == 'mk':
+                    names.update(name)
+                else:
+                    names.add(_xref_key_name(name))
+
+        resolved = self.data['resolved']
+        updated  = set()
+        for xref_key, docnames in _iteritems(self.data['citers']):
+            prev  = resolved.get(xref_key, False)
+            if (prev is not False
+                    and _xref_key_name(xref_key[2]) not in names
+                    and cleared_docs.isdisjoint(_resolved_docnames(xref_key[0], prev))):
+                continue
+            found = self._find_xref_key(xref_key)
+            if isinstance(found, ObjectEntry):
+                if (found.docname not in cleared_docs and prev
+                        and prev[1:] == (found.docname, found.refname)):
+                    continue
+                found = found.to_xref_target()
+            if found == prev:
+                continue
+            resolved[xref_key] = found
+            if prev is not False:
+                # the docs just read are written anyway.
+                updated.update(docnames)
+        return updated
+
+    def merge_domaindata(self, docnames, otherdata):
+        self.xref_index   = None
+        self.any_index    = None
+        self.object_index = None
+        if self.objects_cache:
+            for docname in docnames:
+                self.objects_cache.pop(docname, None)
+        for docname in docnames:
+            if docname in otherdata['cited']:
+                xref_keys = otherdata['cited'][docname]
+                self.data['cited'][docname] = xref_keys
+                citers = self.data['citers']
+                for xref_key in xref_keys:
+                    citers.setdefault(xref_key, set()).add(docname)
+
+        # objects, modules and markers are registered by replay_reads when
+        # all the processes are merged, which may finish in any order.
+        if self.merged_reads is None:
+            self.merged_reads = []
+        self.merged_reads.append((docnames, otherdata['reads']))
+
+    def replay_reads(self):
+        """
+        Register the objects, modules and markers read by the processes of
+        parallel reading, in the order of serial reading of their
+        documents.
+
+        The same descriptions win, and the same duplicates are warned,
+        as by serial reading.
+        """
+        merged_reads = self.merged_reads
+        if not merged_reads:
+            return
+        self.merged_reads = None
+        self.xref_index   = None
+        self.any_index    = None
+        self.object_index = None
+        self.marker_index = None
+
+        rank = dict((docname, i) for (i, docname) in enumerate(self.read_order or ()))
+        merged_reads.sort(key=lambda item: min(
+            (rank.get(docname, len(rank)), docname) for docname in item[0]))
+        for docnames, reads in merged_reads:
+            for read in reads:
+                if read[0] == 'obj':
+                    self._note_object(*(read[1:] + (True,)))
+                elif read[0] == 'mod':
+                    self._add_module(*(read[1:] + (True,)))
+                else:
+                    self.note_marker(*read[1:])
+            # only the entries kept above refer to their types.
+            for docname in docnames:
+                doc_types = self._doc_spec_types(docname)
+                if doc_types:
+                    self._note_doc_types(docname, doc_types)
 
     def _find_obj(self, env, env_modname, name, typ, searchorder=0):
         """
@@ -1408,77 +3969,331 @@ class ErlangDomain(Domain):
             modname = sigdata.modname
         objname = '%s:%s' % (modname, sigdata.name)
 
-        oinv = self.data['objects'][nsname]
-        if objname not in oinv:
+        flavors = self.data['objects'][nsname].get(objname)
+        if flavors is None:
             return None
 
-        if sigdata.arity in oinv[objname]:
-            flavors = oinv[objname][sigdata.arity]
-        elif sigdata.arity is None:
-            arity   = min(oinv[objname])
-            flavors = oinv[objname][arity]
+        arity = sigdata.arity
+        if arity is None:
+            arity_los = [piece[0] for pieces in flavors.values() for piece in pieces]
+            if None not in arity_los:
+                # the smallest arity of any flavor.
+                arity = min(arity_los)
+
+        return _find_interval(flavors.get(sigdata.flavor, ()), arity)
+
+    def build_xref_index(self):
+        """
+        Precompute the entry of every lookup name of objects, so that
+        resolve_xref does not need to parse most of targets. Names with
+        arity are not precomputed, see _lookup_arity_name.
+        """
+        index = {}
+        for nsname, oinv in _iteritems(self.data['objects']):
+            for objname, flavors in _iteritems(oinv):
+                arity_los = []
+                for flavor, pieces in _iteritems(flavors):
+                    for arity_lo, arity_hi, entry in pieces:
+                        arity_los.append(arity_lo)
+                        for arity in entry.lookup_arities(arity_lo, arity_hi):
+                            for name in entry.lookup_names(arity, flavor):
+                                index[(nsname, name)] = entry
+                if None not in arity_los:
+                    # same as _find_obj, the smallest arity is used
+                    # if a target has no arity.
+                    min_arity = min(arity_los)
+                    for flavor, pieces in _iteritems(flavors):
+                        entry = _find_interval(pieces, min_arity)
+                        if entry is None:
+                            continue
+                        for name in entry.lookup_names(None, flavor):
+                            index[(nsname, name)] = entry
+        self.xref_index = index
+        self.any_index  = None
+
+    def get_object_index(self, nsname):
+        """
+        Return entries of ErlangObjectIndex of `nsname`, letter -> entries.
+
+        Indices of all namespaces are built in one pass over objects.
+        """
+        if self.object_index is None:
+            modules = self.data['modules']
+            object_index = {}
+            for ns, oinv in _iteritems(self.data['objects']):
+                rows = []
+                for flavors in oinv.values():
+                    for flavor, pieces in _iteritems(flavors):
+                        for arity_lo, arity_hi, entry in pieces:
+                            if entry.alias:
+                                # listed with its flavor.
+                                continue
+                            sigdata = entry.sigdata
+                            rows.append((_index_letter(sigdata.name), sigdata.modname,
+                                         sigdata.name.lower(), arity_lo or 0, flavor or '',
+                                         arity_lo, arity_hi, entry))
+                rows.sort(key=lambda row: row[:5])
+
+                buckets = object_index[ns] = {}
+                prev = None
+                for letter, modname, _name, _arity, flavor, arity_lo, arity_hi, entry in rows:
+                    entries = buckets.setdefault(letter, [])
+                    if prev != (letter, modname):
+                        if modname in modules:
+                            entries.append([modname, 1, modules[modname][0],
+                                            'module-' + modname, '', '', ''])
+                        else:
+                            entries.append([modname, 1, '', '', '', '', ''])
+                        prev = (letter, modname)
+                    qualifier = entry.deprecated and _('Deprecated') or ''
+                    entries.append([entry.index_name(arity_lo, arity_hi, flavor or None), 2,
+                                    entry.docname, entry.refname, '', qualifier, ''])
+            self.object_index = object_index
+        return self.object_index.get(nsname, {})
+
+    def _lookup_xref_index(self, env_modname, target, typ):
+        if self.xref_index is None:
+            return None
+        if ':' in target:
+            name = target
         else:
+            name = '%s:%s' % (env_modname, target)
+        nsname = ErlangObject.namespace_of_role(typ)
+        entry = self.xref_index.get((nsname, name))
+        if entry is None:
+            entry = self._lookup_arity_name(nsname, name)
+        return entry
+
+    def _lookup_arity_name(self, nsname, name):
+        # 'module:name/arity' -> Optional[ObjectEntry], by the interval of
+        # the arity. a sigil is allowed before the name of a macro.
+        m = RE_ARITY_NAME.match(name)
+        if m is None:
             return None
+        objname = m.group('name')
+        if nsname == 'macro':
+            objname = objname.replace(':?', ':', 1)
+        flavors = self.data['objects'][nsname].get(objname)
+        if flavors is None:
+            return None
+        return _find_interval(flavors.get(m.group('flavor'), ()), int(m.group('arity')))
 
-        if sigdata.flavor not in flavors:
+    def _find_module(self, target):
+        if target not in self.data['modules']:
             return None
+        docname, synopsis, platform, deprecated = self.data['modules'][target]
+        title = target
+        if synopsis:
+            title += ': ' + synopsis
+        if deprecated:
+            title += _(' (deprecated)')
+        if platform:
+            title += ' (' + platform + ')'
+        refname = 'module-' + target
+        return title, docname, refname
+
+    def _find_marker(self, target, env_modname):
+        # target is 'marker', 'module:marker' or 'module#marker'.
+        # a marker out of the current module is found if it is the only
+        # module which has the marker, or the first one of them.
+        k_inv = self.data['markers']
+        modname, sep, marker_name = target.rpartition('#')
+        if not sep:
+            modname, sep, marker_name = target.rpartition(':')
+        if sep:
+            k_entry = k_inv.get((modname, marker_name))
         else:
-            entry = flavors[sigdata.flavor]
-
-        if entry.objtype == 'callback':
-            title = '%s (%s)' % (entry.dispname, _('callback function'))
-        elif entry.objtype == 'function':
-            title = entry.dispname
-        elif entry.objtype == 'macro':
-            title = entry.dispname
-        elif entry.objtype == 'record':
-            title = entry.dispname
-        elif entry.objtype == 'opaque':
-            title = '%s %s' % (entry.dispname, _('opaque type'))
-        elif entry.objtype == 'type':
-            title = '%s %s' % (entry.dispname, _('type'))
+            k_entry = k_inv.get((env_modname, marker_name))
+            if k_entry is None:
+                modnames = self._get_marker_index().get(marker_name)
+                if modnames:
+                    k_entry = k_inv[(modnames[0], marker_name)]
+        if k_entry is None:
+            return None
+        return target, k_entry.docname, k_entry.refname
+
+    def _get_marker_index(self):
+        if self.marker_index is None:
+            index = {}
+            for modname, marker_name in self.data['markers']:
+                index.setdefault(marker_name, []).append(modname)
+            for modnames in index.values():
+                modnames.sort()
+            self.marker_index = index
+        return self.marker_index
+
+    def _find_xref(self, env, typ, target, env_modname, searchorder=0):
+        # -> ObjectEntry, (title, docname, refname) or None.
+        if typ == 'mod':
+            return self._find_module(target)
+        elif typ == 'seealso':
+            return self._find_marker(target, env_modname)
+        elif typ == 'marker':
+            return None
+        found = self._lookup_xref_index(env_modname, target, typ)
+        if found is None:
+            # not a precomputed lookup name, e.g. extra spaces.
+            _count('xref_index.misses')
+            found = self._find_obj(env, env_modname, target, typ, searchorder)
         else:
-            raise ValueError
+            _count('xref_index.hits')
+        return found
 
-        return title, entry.docname, entry.refname
+    def _find_xref_key(self, xref_key):
+        # -> result of _find_xref, or a tuple of results of _find_any.
+        role, modname, target = xref_key
+        if role == 'any':
+            return tuple(self._find_any(target, modname))
+        return self._find_xref(self.env, role, target, modname)
 
     def resolve_xref(self, env, fromdocname, builder,
                      typ, target, node, contnode):
-        if typ == 'mod':
-            if target not in self.data['modules']:
-                return None
-            docname, synopsis, platform, deprecated = self.data['modules'][target]
-            title = target
-            if synopsis:
-                title += ': ' + synopsis
-            if deprecated:
-                title += _(' (deprecated)')
-            if platform:
-                title += ' (' + platform + ')'
-            refname = 'module-' + target
-            return make_refnode(builder, fromdocname, docname, refname,
-                                contnode, title)
-        elif typ == 'seealso':
-            if target not in self.data['markers']:
-                return None
-            k_entry = self.data['markers'][target]
-            title   = target
-            docname = k_entry.docname
-            refname = k_entry.refname
-            return make_refnode(builder, fromdocname, docname, refname,
-                                contnode, title)
-        elif typ == 'marker':
+        env_modname = node.get('erl:module')
+        searchorder = node.hasattr('refspecific') and 1 or 0
+        found = self._find_xref(env, typ, target, env_modname, searchorder)
+        if found is None:
             return None
+        if isinstance(found, ObjectEntry):
+            found = found.to_xref_target()
+        title, docname, refname = found
+        return make_refnode(builder, fromdocname, docname, refname,
+                            contnode, title)
+
+    def _build_any_index(self):
+        # lookup name -> list of (role, (title, docname, refname) or ObjectEntry).
+        # modules are looked up by their names, objects by their qualified
+        # lookup names. see build_xref_index. markers are not indexed, they
+        # are found by _find_marker.
+        index = {}
+        for modname in self.data['modules']:
+            index.setdefault(modname, []).append(('mod', self._find_module(modname)))
+        for (nsname, name), entry in _iteritems(self.xref_index):
+            role = ErlangObject.ROLE_FROM_NAMESPACE[nsname]
+            index.setdefault(name, []).append((role, entry))
+        self.any_index = index
+
+    def _find_any(self, target, env_modname):
+        # yields (role, (title, docname, refname)).
+        if self.xref_index is None:
+            self.build_xref_index()
+        if self.any_index is None:
+            self._build_any_index()
+
+        results = list(self.any_index.get(target, []))
+        if ':' in target:
+            name = target
         else:
-            env_modname = node.get('erl:module')
-            searchorder = node.hasattr('refspecific') and 1 or 0
-            found = self._find_obj(env, env_modname, target, typ, searchorder)
-            if found is None:
-                return None
-            else:
-                title, docname, refname = found
-                return make_refnode(builder, fromdocname, docname, refname,
-                                    contnode, title)
+            name = '%s:%s' % (env_modname, target)
+            results.extend(self.any_index.get(name, []))
+        for nsname in self.data['objects']:
+            entry = self._lookup_arity_name(nsname, name)
+            if entry is not None:
+                results.append((ErlangObject.ROLE_FROM_NAMESPACE[nsname], entry))
+
+        found = self._find_marker(target, env_modname)
+        if found is not None:
+            results.append(('seealso', found))
+
+        for role, found in results:
+            if isinstance(found, ObjectEntry):
+                found = found.to_xref_target()
+            yield (role, found)
+
+    def resolve_any_xref(self, env, fromdocname, builder, target, node, contnode):
+        return [('erl:' + role,
+                 make_refnode(builder, fromdocname, docname, refname,
+                              contnode, title))
+                for role, (title, docname, refname)
+                in self._find_any(target, node.get('erl:module'))]
+
+    def _open_external_index(self, env):
+        if sqlite3 is not None:
+            path = os.path.join(env.doctreedir, ExternalInventoryCache.FILENAME)
+            try:
+                self.external_index = ExternalInventoryCache(path, env)
+                return
+            except (sqlite3.Error, OSError) as exc:
+                _warn(env, 'cannot use %s, keep external Erlang objects in memory: %s',
+                      path, exc)
+
+        index = {}
+        for uri, invs in _intersphinx_sources(env.config):
+            for inv in invs:
+                try:
+                    entries = list(_external_inventory_entries(_read_inventory(env, inv)))
+                except Exception:
+                    # warned by sphinx.ext.intersphinx, or not an inventory.
+                    continue
+                for nsname, modname, name, flavor, arity_lo, arity_hi, item in entries:
+                    (project, version, location, dispname) = item
+                    item = (project, version, posixpath.join(uri, location), dispname)
+                    pieces = index.setdefault((nsname, modname, name), {}).setdefault(flavor, [])
+                    pieces.append((arity_lo, arity_hi, item))
+                break
+        self.external_index = index
+
+    def close_external_index(self):
+        if isinstance(self.external_index, ExternalInventoryCache):
+            self.external_index.close()
+        self.external_index = None
+
+    def resolve_external_xref(self, env, node, contnode):
+        """
+        Resolve a reference to an object in intersphinx inventories with the
+        same rules as _find_obj, e.g. ``lists:map`` means the smallest arity.
+        """
+        typ = node['reftype']
+        if typ not in ErlangObject.NAMESPACE_FROM_ROLE:
+            return None
+        if not getattr(env.config, 'intersphinx_mapping', None):
+            return None
+        if self.external_index is None:
+            # on the first missing reference.
+            self._open_external_index(env)
+
+        nsname = ErlangObject.namespace_of_role(typ)
+        try:
+            sigdata = ErlangSignature.from_text(node['reftarget'], nsname, None)
+        except ValueError:
+            return None
+        if sigdata.modname is None:
+            modname = node.get('erl:module')
+        else:
+            modname = sigdata.modname
+
+        flavors = self.external_index.get((nsname, modname, sigdata.name))
+        if flavors is None:
+            _count('external_index.misses')
+            return None
+        _count('external_index.hits')
+
+        arity = sigdata.arity
+        if arity is None:
+            arity_los = [piece[0] for pieces in flavors.values() for piece in pieces]
+            if None not in arity_los:
+                # the smallest arity of any flavor.
+                arity = min(arity_los)
+
+        # the first inventory which has the arity takes precedence.
+        item = _find_interval(flavors.get(sigdata.flavor, ()), arity)
+        if item is None:
+            return None
+
+        # same as sphinx.ext.intersphinx.
+        proj, version, uri, dispname = item
+        if '://' not in uri and node.get('refdoc'):
+            # get correct path in case of subdirectories
+            uri = posixpath.join(*(['..'] * node['refdoc'].count('/') + [uri]))
+        if version:
+            reftitle = _('(in %s v%s)') % (proj, version)
+        else:
+            reftitle = _('(in %s)') % (proj,)
+        newnode = nodes.reference('', '', internal=False, refuri=uri, reftitle=reftitle)
+        if node.get('refexplicit') or dispname == '-':
+            newnode.append(contnode)
+        else:
+            newnode.append(contnode.__class__(dispname, dispname))
+        return newnode
 
     # get_objects returns a tuple with 6 elements.
     # [0]: fullname to identify the object in a domain implementation.
@@ -1491,15 +4306,46 @@ class ErlangDomain(Domain):
         for modname, info in _iteritems(self.data['modules']):
             yield (modname, modname, 'module', info[0], 'module-' + modname, 0)
 
-        for _k_name, k_entry in _iteritems(self.data['markers']):
+        for k_entry in self.data['markers'].values():
             yield k_entry.to_intersphinx_target()
 
-        for nsname, oinv in _iteritems(self.data['objects']):
-            for objname, arities in _iteritems(oinv):
-                for arity, flavors in _iteritems(arities):
-                    for flavor, entry in _iteritems(flavors):
-                        for objname in entry.intersphinx_names(arity, flavor):
-                            yield entry.to_intersphinx_target(objname)
+        if self.objects_cache is None:
+            self.objects_cache = {}
+        for docname in self.data['docs']:
+            targets = self.objects_cache.get(docname)
+            if targets is None:
+                _count('objects_cache.misses')
+                targets = list(self._generate_doc_objects(docname))
+                self.objects_cache[docname] = targets
+            else:
+                _count('objects_cache.hits')
+            for target in targets:
+                yield target
+
+    def _generate_doc_objects(self, docname):
+        # objects in docname for get_objects.
+        def sort_key(key):
+            nsname, objname, flavor = key
+            return (nsname, objname, flavor or '')
+
+        compact = self.env.config['erl_inventory_mode'] == 'compact'
+        for key in sorted(self.data['docs'][docname], key=sort_key):
+            nsname, objname, flavor = key
+            if nsname in ('mod', 'mk'):
+                continue
+            pieces = self.data['objects'][nsname].get(objname, {}).get(flavor, ())
+            for arity_lo, arity_hi, entry in pieces:
+                if entry.docname != docname:
+                    continue
+                if compact:
+                    # an interval is written once as 'name/lo..hi', see
+                    # resolve_external_xref.
+                    yield entry.to_intersphinx_target(
+                        entry.canonical_name(arity_lo, flavor, arity_hi))
+                    continue
+                for arity in _arities(arity_lo, arity_hi):
+                    for fullname in entry.intersphinx_names(arity, flavor):
+                        yield entry.to_intersphinx_target(fullname)
 
     # since sphinx 1.6.
     def get_full_qualified_name(self, node):
@@ -1522,5 +4368,370 @@ class ErlangDomain(Domain):
         return sig_data.to_full_qualified_name()
 
 
+def on_env_before_read_docs(app, env, docnames):
+    domain = env.get_domain('erl')
+    domain.read_order = docnames
+    domain.read_pid   = os.getpid()
+
+    # extract sources which erl:automodule read when the documents were read
+    # last time, noted as their dependencies.
+    paths = [os.path.join(env.srcdir, path)
+             for docname in docnames
+             for path in env.dependencies.get(docname, ())
+             if path.endswith(ERLANG_SOURCE_SUFFIXES)]
+    if paths:
+        _extract_erlang_sources(env, paths)
+
+
+# {{{ search index.
+
+# shards of the search index are written into SEARCH_INDEX_DIR of _static,
+# and shards of the type index into TYPE_INDEX_DIR.
+SEARCH_INDEX_DIR = 'erl-search'
+TYPE_INDEX_DIR   = 'erl-types'
+
+def _search_shard(modname):
+    # -> name of the shard of modname. same as shardOf of ERL_SEARCH_JS.
+    return re.sub(r'[^a-z0-9_]', '_', modname.lower()[:2])
+
+def iter_search_entries(domain, builder):
+    """
+    Yield (modname, module uri or None, [[name, objtype, uri], ...]) of
+    each module, where name is 'name/arity' or 'name/arity@flavor', and
+    'name/lo..hi' for an interval of arities.
+    """
+    objects = {}
+    for oinv in domain.data['objects'].values():
+        for flavors in oinv.values():
+            for flavor, pieces in _iteritems(flavors):
+                for arity_lo, arity_hi, entry in pieces:
+                    if entry.alias:
+                        continue
+                    modname = entry.sigdata.modname
+                    uri = '%s#%s' % (builder.get_target_uri(entry.docname), entry.refname)
+                    name = entry.canonical_name(arity_lo, flavor, arity_hi)[len(modname) + 1:]
+                    objects.setdefault(modname, []).append([name, entry.objtype, uri])
+
+    modules = domain.data['modules']
+    for modname in sorted(set(objects) | set(modules)):
+        if modname in modules:
+            module_uri = '%s#module-%s' % (builder.get_target_uri(modules[modname][0]), modname)
+        else:
+            module_uri = None
+        yield modname, module_uri, sorted(objects.get(modname, ()))
+
+def iter_type_entries(domain, builder):
+    """
+    Yield (type key, [[position, fullname, objtype, uri], ...]) of the type
+    index, see ErlangDomain.find_by_type.
+    """
+    for type_key, items in sorted(_iteritems(domain.data['types'])):
+        yield type_key, sorted(
+            [position, fullname, objtype,
+             '%s#%s' % (builder.get_target_uri(docname), refname)]
+            for (position, fullname, objtype, docname, refname) in items)
+
+def write_search_index(domain, builder):
+    """
+    Write the search index of Erlang objects, one JSON file per shard of
+    module names, into ``_static/erl-search``, and the type index, one JSON
+    file per shard of type names, into ``_static/erl-types``.
+    """
+    shards = {}
+    for modname, module_uri, objects in iter_search_entries(domain, builder):
+        shards.setdefault(_search_shard(modname), {})[modname] = [module_uri, objects]
+    _write_shards(os.path.join(builder.outdir, '_static', SEARCH_INDEX_DIR), shards)
+
+    shards = {}
+    for type_key, items in iter_type_entries(domain, builder):
+        type_name = type_key.rsplit(':', 1)[-1].lstrip('#')
+        shards.setdefault(_search_shard(type_name), {})[type_key] = items
+    _write_shards(os.path.join(builder.outdir, '_static', TYPE_INDEX_DIR), shards)
+
+    with open(os.path.join(builder.outdir, '_static', 'erl-search.js'), 'w') as f:
+        f.write(ERL_SEARCH_JS)
+
+def _write_shards(outdir, shards):
+    # writes shard name -> JSON object into outdir/<shard>.json.
+    # files are only written when their contents are changed.
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    for filename in os.listdir(outdir):
+        if filename.endswith('.json') and filename[:-len('.json')] not in shards:
+            os.remove(os.path.join(outdir, filename))
+    for shard, modules in _iteritems(shards):
+        data = json.dumps(modules, separators=(',', ':'), sort_keys=True).encode('utf-8')
+        path = os.path.join(outdir, shard + '.json')
+        try:
+            with open(path, 'rb') as f:
+                if f.read() == data:
+                    continue
+        except OSError:
+            pass
+        with open(path, 'wb') as f:
+            f.write(data)
+
+# looks up 'module', 'module:name' or 'module:name/arity' of the query on the
+# search page in the shard of the module, or 'type()', 'module:type()' and
+# '-> type()' in the shard of the type, and lists them above the results of
+# the search of Sphinx.
+ERL_SEARCH_JS = r"""/* search index of Erlang objects, generated by sphinxcontrib-erlangdomain. */
+(function () {
+  "use strict";
+  var script = document.currentScript;
+
+  function shardOf(modname) {
+    return modname.toLowerCase().slice(0, 2).replace(/[^a-z0-9_]/g, "_");
+  }
+
+  function contentRoot() {
+    var root = document.documentElement.dataset.content_root;
+    if (root === undefined && window.DOCUMENTATION_OPTIONS) {
+      root = DOCUMENTATION_OPTIONS.URL_ROOT;
+    }
+    return root || "";
+  }
+
+  function find(modules, modname, name, arity) {
+    var results = [];
+    Object.keys(modules).forEach(function (mod) {
+      var module = modules[mod];
+      if (name === null) {
+        if (mod.indexOf(modname) === 0 && module[0] !== null) {
+          results.push([mod, "module", module[0]]);
+        }
+        return;
+      }
+      if (mod !== modname) {
+        return;
+      }
+      module[1].forEach(function (obj) {
+        var slash = obj[0].indexOf("/");
+        var objname = slash < 0 ? obj[0] : obj[0].slice(0, slash);
+        // "name/arity" or "name/lo..hi", without "@flavor".
+        var arities = /\/(\d+)(?:\.\.(\d+))?(?:@|$)/.exec(obj[0]);
+        if (arity === null ? objname.indexOf(name) === 0
+                           : objname === name && arities !== null &&
+                             +arities[1] <= +arity && +arity <= +(arities[2] || arities[1])) {
+          results.push([mod + ":" + obj[0], obj[1], obj[2]]);
+        }
+      });
+    });
+    return results;
+  }
+
+  function findType(types, modname, name, position) {
+    var results = [];
+    Object.keys(types).forEach(function (key) {
+      var match = modname ? key === modname + ":" + name
+                          : key === name || key.slice(-name.length - 1) === ":" + name;
+      if (!match) {
+        return;
+      }
+      types[key].forEach(function (item) {
+        if (position === null || item[0] === position) {
+          results.push([item[1], item[2] + ", " + (item[0] === "ret" ? "returns " : "takes ") + key + "()", item[3]]);
+        }
+      });
+    });
+    return results;
+  }
+
+  function show(results) {
+    var root = contentRoot();
+    var section = document.createElement("div");
+    section.id = "erl-search-results";
+    var title = section.appendChild(document.createElement("h2"));
+    title.textContent = "Erlang";
+    var list = section.appendChild(document.createElement("ul"));
+    list.className = "search";
+    results.forEach(function (result) {
+      var item = list.appendChild(document.createElement("li"));
+      var link = item.appendChild(document.createElement("a"));
+      link.href = root + result[2];
+      link.textContent = result[0];
+      item.appendChild(document.createTextNode(" (" + result[1] + ")"));
+    });
+    var out = document.getElementById("search-results");
+    if (out) {
+      out.parentNode.insertBefore(section, out);
+    } else {
+      (document.querySelector("[role=main]") || document.body).appendChild(section);
+    }
+  }
+
+  function fetchShard(dir, name, find) {
+    var base = script.src.replace(/[^\/]*$/, "") + dir + "/";
+    fetch(base + shardOf(name) + ".json")
+      .then(function (response) { return response.ok ? response.json() : {}; })
+      .then(function (shard) {
+        var results = find(shard);
+        if (results.length) {
+          show(results);
+        }
+      })
+      .catch(function () {});
+  }
+
+  function search() {
+    var query = (new URLSearchParams(window.location.search).get("q") || "").trim();
+    var t = /^(->\s*)?(?:([a-z][\w@]*):)?([a-z][\w@]*)\(\)$/.exec(query);
+    if (t) {
+      fetchShard("erl-types", t[3], function (types) {
+        return findType(types, t[2], t[3], t[1] ? "ret" : null);
+      });
+      return;
+    }
+    // sigils of macros and records are not in the index.
+    var m = /^([a-z][\w@]*)(?::[?#]?([A-Za-z_][\w@]*)?(?:\/(\d+))?)?$/.exec(query);
+    if (!m) {
+      return;
+    }
+    var name = query.indexOf(":") < 0 ? null : (m[2] || "");
+    var arity = m[3] === undefined ? null : m[3];
+    fetchShard("erl-search", m[1], function (modules) {
+      return find(modules, m[1], name, arity);
+    });
+  }
+
+  if (script && window.location.search) {
+    if (document.readyState === "loading") {
+      document.addEventListener("DOMContentLoaded", search);
+    } else {
+      search();
+    }
+  }
+})();
+"""
+
+# }}} search index.
+
+
+def _uses_search_index(app):
+    return app.config.erl_search_index and app.builder.name in ('html', 'dirhtml')
+
+
+# {{{ profiler installation.
+
+# (owner, name) of functions recorded by erl_profile.
+PROFILED_FUNCTIONS = [
+    (ErlangSignatureParser, 'run'),
+    (ErlangBaseObject,      '_construct_nodes'),
+    (ErlangBaseObject,      '_add_target'),
+    (ErlangModuleIndex,     'generate'),
+    (ErlangObjectIndex,     'generate'),
+    (ErlangDomain,          'clear_doc'),
+    (ErlangDomain,          '_doc_spec_types'),
+    (ErlangDomain,          'get_updated_docs'),
+    (ErlangDomain,          '_find_obj'),
+    (ErlangDomain,          'get_object_index'),
+    (ErlangDomain,          'resolve_xref'),
+    (ErlangDomain,          'resolve_any_xref'),
+    (ErlangDomain,          'resolve_external_xref'),
+    (ErlangDomain,          'get_objects'),
+    (sys.modules[__name__], 'write_search_index'),
+]
+
+# (owner, name) -> function replaced by _install_profiler.
+_unprofiled_functions = {}
+
+def _install_profiler(enabled):
+    # wrap PROFILED_FUNCTIONS with _profiled, or restore them, so that builds
+    # without erl_profile do not pay for profiling.
+    for owner, name in PROFILED_FUNCTIONS:
+        key = (owner, name)
+        if enabled == (key in _unprofiled_functions):
+            continue
+        if enabled:
+            func = vars(owner)[name]
+            _unprofiled_functions[key] = func
+            if isinstance(func, classmethod):
+                setattr(owner, name, classmethod(_profiled(func.__func__)))
+            else:
+                setattr(owner, name, _profiled(func))
+        else:
+            setattr(owner, name, _unprofiled_functions.pop(key))
+
+
+def on_doctree_read(app, doctree):
+    # counts of a process of parallel reading are sent back to the main
+    # process with its environment, see on_env_merge_info.
+    if not _profiler.is_main_process():
+        app.env.erl_profile = _profiler.snapshot()
+
+
+def on_env_merge_info(app, env, docnames, other):
+    snapshot = getattr(other, 'erl_profile', None)
+    if snapshot is not None:
+        _profiler.merge(snapshot)
+
+# }}} profiler installation.
+
+
+def on_builder_inited(app):
+    global _profiler
+    _profiler = ErlangProfiler() if app.config.erl_profile else None
+    _install_profiler(_profiler is not None)
+    if _profiler is not None:
+        app.connect('doctree-read', on_doctree_read)
+        app.connect('env-merge-info', on_env_merge_info)
+    if _uses_search_index(app):
+        if hasattr(app, 'add_js_file'):
+            app.add_js_file('erl-search.js')
+        else:
+            # sphinx 1.7 and prior.
+            app.add_javascript('erl-search.js')
+    if app.config.erl_split_index:
+        domain = app.env.get_domain('erl')
+        for index_cls in OBJECT_INDICES:
+            domain.indices.extend(index_cls.letter_index(letter) for letter in INDEX_LETTERS)
+
+
+def on_build_finished(app, exception):
+    app.env.get_domain('erl').close_external_index()
+    if exception is None:
+        prune_erlang_source_cache(app.env)
+    if exception is None and _uses_search_index(app):
+        write_search_index(app.env.get_domain('erl'), app.builder)
+    if _profiler is None:
+        return
+    path = os.path.join(app.outdir, 'erl-profile.json')
+    with open(path, 'w') as f:
+        json.dump(_profiler.report(), f, indent=2, sort_keys=True)
+
+
+def on_env_updated(app, env):
+    domain = env.get_domain('erl')
+    domain.replay_reads()
+    domain.build_xref_index()
+
+
+def on_env_get_updated(app, env):
+    return env.get_domain('erl').get_updated_docs()
+
+
+def on_missing_reference(app, env, node, contnode):
+    if node.get('refdomain') != 'erl':
+        return None
+    return env.get_domain('erl').resolve_external_xref(env, node, contnode)
+
+
 def setup(app):
     app.add_domain(ErlangDomain)
+    app.add_config_value('erl_inventory_mode', 'full', 'html')
+    app.add_config_value('erl_source_path', [], 'env')
+    app.add_config_value('erl_beam_path', [], 'env')
+    app.add_config_value('erl_profile', False, '')
+    app.add_config_value('erl_split_index', False, 'html')
+    app.add_config_value('erl_search_index', False, 'html')
+    app.connect('builder-inited', on_builder_inited)
+    app.connect('build-finished', on_build_finished)
+    app.connect('env-before-read-docs', on_env_before_read_docs)
+    app.connect('env-updated', on_env_updated)
+    app.connect('env-get-updated', on_env_get_updated)
+    app.connect('missing-reference', on_missing_reference)
+
+    return {
+        'parallel_read_safe' : True,
+        'parallel_write_safe': True,
+    }
@@ -27,6 +27,9 @@ needs_sphinx = '1.0'
 # coming with Sphinx (named 'sphinx.ext.*') or your custom ones.
 extensions = ['sphinxcontrib.erlangdomain']
 
+# Directories of Erlang sources for erl:automodule, relative to this directory.
+erl_source_path = ['src']
+
 # Add any paths that contain templates here, relative to this directory.
 templates_path = ['_templates']
 
@@ -0,0 +1,104 @@
+"""
+Write user_cache.chunk, an EEP-48 documentation chunk in the Markdown
+format of OTP 27 and later, for test_beam.rst.
+
+The chunk is written by hand as erlc is not needed to run the test.
+Atoms are encoded by each atom tag of the external term format, and the
+author is a latin-1 atom of the old ATOM_EXT.
+
+Run ``python user_cache_chunk.py`` in this directory after changing it.
+"""
+
+import struct
+
+
+def atom(name, tag=119):
+    # SMALL_ATOM_UTF8_EXT by default.
+    data = name.encode('latin-1' if tag in (100, 115) else 'utf-8')
+    size_fmt = '>H' if tag in (100, 118) else '>B'
+    return bytes([tag]) + struct.pack(size_fmt, len(data)) + data
+
+def binary(text):
+    data = text.encode('utf-8')
+    return b'm' + struct.pack('>I', len(data)) + data
+
+def integer(value):
+    return b'a' + bytes([value])
+
+def tuple_(*elems):
+    return b'h' + bytes([len(elems)]) + b''.join(elems)
+
+def list_(*elems):
+    if not elems:
+        return b'j'
+    return b'l' + struct.pack('>I', len(elems)) + b''.join(elems) + b'j'
+
+def map_(*pairs):
+    return b't' + struct.pack('>I', len(pairs)) + b''.join(k + v for (k, v) in pairs)
+
+def doc(text):
+    return map_((binary('en'), binary(text)))
+
+def entry(kind, name, arity, line, signature, text, metadata=()):
+    return tuple_(
+        tuple_(atom(kind), atom(name), integer(arity)),
+        map_((atom('location'), integer(line))),
+        list_(binary(signature)),
+        doc(text) if text is not None else atom('hidden'),
+        map_(*metadata))
+
+
+MODULE_DOC = """\
+A cache of users in front of `m:user_db`.
+
+Entries expire after `ttl/0` seconds, see [`put/2`](`put/2`).
+
+## Eviction {: #eviction }
+
+- Entries are evicted by a *least recently used* policy.
+- `c:handle_evict/1` is called for each evicted `t:key/0`.
+"""
+
+GET_DOC = """\
+Return the value of `Key`, or `undefined`.
+
+```erlang
+1> user_cache:get(42).
+undefined
+```
+"""
+
+PUT_DOC = """\
+Put `Value` of `Key`, which replaces the previous one.
+
+> #### Note {: .info }
+>
+> Values are copied, **not** shared with the caller.
+
+| Key type | Stored as |
+|----------|-----------|
+| `t:key/0` | atom_or_int |
+"""
+
+CHUNK = b'\x83' + tuple_(
+    atom('docs_v1', 100),
+    map_((atom('location', 115), integer(1))),
+    atom('erlang', 118),
+    binary('text/markdown'),
+    doc(MODULE_DOC),
+    map_((atom('authors'), list_(atom('Jos\xe9', 100)))),
+    list_(
+        entry('type', 'key', 0, 5, 'key()', 'Key of a cached user, an integer or an atom.'),
+        entry('function', 'get', 1, 10, 'get(Key)', GET_DOC),
+        entry('function', 'put', 2, 20, 'put(Key, Value)', PUT_DOC),
+        entry('function', 'purge', 0, 30, 'purge()', 'Remove all the entries.',
+              [(atom('deprecated'), binary('use clear/0 instead'))]),
+        entry('function', 'internal', 0, 40, 'internal()', None),
+        entry('callback', 'handle_evict', 1, 50, 'handle_evict(Key)',
+              'Called when `Key` is evicted from the cache.'),
+    ))
+
+
+if __name__ == '__main__':
+    with open('user_cache.chunk', 'wb') as f:
+        f.write(CHUNK)
@@ -0,0 +1,37 @@
+%% Sample module for erl:automodule.
+-module(user_db).
+
+-export([lookup/1, lookup/2, insert/2, fold/3]).
+-export_type([user_id/0, user/0]).
+
+-include("user_db.hrl").
+
+-type user_id() :: non_neg_integer().
+-opaque user() :: #user{}.
+-type fold_fun(Acc) :: fun((user(), Acc) -> Acc).
+
+-callback handle_insert(User :: user()) -> ok | {error, term()}.
+
+%% Looks up a user.
+-spec lookup(Id :: user_id()) -> {ok, user()} | error.
+lookup(Id) ->
+    lookup(Id, infinity).
+
+-spec lookup(Id, Timeout) -> {ok, user()} | error
+    when Id :: user_id(),
+         Timeout :: timeout().
+lookup(_Id, _Timeout) ->
+    error.
+
+-spec insert(user_id(), string()) -> ok;
+            (user_id(), binary()) -> ok.
+insert(_Id, _Name) ->
+    ok.
+
+-spec(fold(fold_fun(Acc), Acc, [user_id()]) -> Acc).
+fold(_Fun, Acc, _Ids) ->
+    Acc.
+
+-spec format(user()) -> string().
+format(#user{name = Name}) ->
+    "user: " ++ Name.